@@ -0,0 +1,177 @@
+import asyncio
+from typing import Any, AsyncIterator, Iterable, List, Tuple, Union
+
+import aiohttp
+
+from embedding_cache import EmbeddingCache
+from embedding_store import EmbeddingStoreWriter
+
+RETRY_STATUSES = {500, 502, 503, 504}
+
+
+async def _aiter(records: Union[Iterable, AsyncIterator]) -> AsyncIterator:
+    """Iterate a sync or async iterable of records asynchronously."""
+    if hasattr(records, "__aiter__"):
+        async for rec in records:
+            yield rec
+    else:
+        for rec in records:
+            yield rec
+            await asyncio.sleep(0)
+
+
+class AsyncEmbedderClient:
+    """
+    asyncio counterpart of EmbedderClient for the /embed service.
+
+    `stream()` reads chunk dicts from a sync or async iterable, groups them into
+    batches, keeps up to `concurrency` requests in flight and yields
+    (record, vector) pairs as batches complete, so reading, embedding and
+    writing overlap. Use as an async context manager:
+
+        async with AsyncEmbedderClient() as client:
+            async for rec, vec in client.stream(chunks):
+                ...
+    """
+
+    def __init__(self, endpoint: str = "http://localhost:8000/embed", timeout: int = 30,
+                 batch_size: int = 64, max_batch_chars: int = 32000, concurrency: int = 4,
+                 max_retries: int = 3, backoff: float = 0.5, cache: EmbeddingCache = None,
+                 text_key: str = "text"):
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.max_batch_chars = max_batch_chars
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.cache = cache
+        self.text_key = text_key
+        self.session = None
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.concurrency),
+            timeout=aiohttp.ClientTimeout(total=self.timeout)
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+        self.session = None
+
+    async def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        """Embed one batch, retrying connection errors and 5xx responses with backoff."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self.session.post(self.endpoint, json={"texts": texts}) as resp:
+                    if resp.status in RETRY_STATUSES and attempt < self.max_retries:
+                        raise aiohttp.ClientResponseError(resp.request_info, resp.history, status=resp.status)
+                    resp.raise_for_status()
+                    data = await resp.json()
+                break
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                retryable = not isinstance(e, aiohttp.ClientResponseError) or e.status in RETRY_STATUSES
+                if attempt >= self.max_retries or not retryable:
+                    raise RuntimeError(f"Embedding request failed: {e}") from e
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+        if "vectors" not in data or len(data["vectors"]) != len(texts):
+            raise RuntimeError(f"Unexpected response format: {str(data)[:200]}")
+        return data["vectors"]
+
+    async def _batches(self, records) -> AsyncIterator[List[dict]]:
+        batch, chars = [], 0
+        async for rec in _aiter(records):
+            text = rec[self.text_key]
+            if batch and (len(batch) >= self.batch_size or chars + len(text) > self.max_batch_chars):
+                yield batch
+                batch, chars = [], 0
+            batch.append(rec)
+            chars += len(text)
+        if batch:
+            yield batch
+
+    async def stream(self, records) -> AsyncIterator[Tuple[dict, Any]]:
+        """
+        Yield (record, vector) pairs in completion order (order within a batch is kept).
+        At most 2 * concurrency finished batches wait for the consumer, so a slow
+        consumer holds back the requests instead of piling results up in memory.
+        Stopping early cancels the requests still in flight.
+        """
+        results = asyncio.Queue(maxsize=2 * self.concurrency)
+        slots = asyncio.Semaphore(self.concurrency)
+        cache_lock = asyncio.Lock()   # EmbeddingCache is not thread-safe; its file IO runs in a thread
+        tasks = set()
+        done = object()
+
+        async def run(batch):
+            try:
+                texts = [rec[self.text_key] for rec in batch]
+                vectors = await self.embed_texts(texts)
+                if self.cache is not None:
+                    async with cache_lock:
+                        await asyncio.to_thread(self.cache.put_many, texts, vectors)
+                await results.put((batch, vectors))
+            except Exception as e:
+                await results.put(e)
+            finally:
+                slots.release()
+
+        async def produce():
+            try:
+                async for batch in self._batches(records):
+                    if self.cache is not None:
+                        async with cache_lock:
+                            cached = await asyncio.to_thread(
+                                self.cache.get_many, [rec[self.text_key] for rec in batch])
+                        hits = [(rec, vec) for rec, vec in zip(batch, cached) if vec is not None]
+                        if hits:
+                            await results.put(([rec for rec, _ in hits], [vec for _, vec in hits]))
+                        batch = [rec for rec, vec in zip(batch, cached) if vec is None]
+                        if not batch:
+                            continue
+                    await slots.acquire()
+                    task = asyncio.create_task(run(batch))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                await asyncio.gather(*tasks)
+            except Exception as e:
+                await results.put(e)
+            # not reached when cancelled: nobody is reading any more
+            await results.put(done)
+
+        producer = asyncio.create_task(produce())
+        try:
+            while True:
+                item = await results.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                for rec, vec in zip(*item):
+                    yield rec, vec
+        finally:
+            pending = [producer, *tasks]
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def embed_to_store(records, store_path, client: AsyncEmbedderClient = None, dtype: str = "float32") -> int:
+    """
+    Stream records through the embedding service straight into an EmbeddingStore.
+    Returns the number of records written.
+    """
+    own_client = client is None
+    client = client or AsyncEmbedderClient()
+    if own_client:
+        await client.__aenter__()
+    try:
+        with EmbeddingStoreWriter(store_path, dtype=dtype) as writer:
+            async for rec, vec in client.stream(records):
+                writer.append(rec, vec)
+    finally:
+        if own_client:
+            await client.__aexit__(None, None, None)
+    print(f"Saved {writer.count} records to {store_path}")
+    return writer.count
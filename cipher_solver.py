@@ -0,0 +1,218 @@
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from entropy_stats import voynich_units, reference_units
+from pre_processing import iter_takahashi
+from vocabulary import normalize_token
+
+SPACE = ' '
+
+
+def _unit_streams(units, alphabet_index):
+    """Encode each unit as ' word word ' symbol ids; symbols outside the alphabet are dropped."""
+    streams = []
+    for words in units:
+        text = SPACE + SPACE.join(words) + SPACE
+        ids = [alphabet_index[ch] for ch in text if ch in alphabet_index]
+        streams.append(np.asarray(ids, dtype=np.int64))
+    return streams
+
+
+def _count_ngrams(streams, n):
+    """Distinct n-grams (rows) and their counts over all streams, never spanning two streams."""
+    windows = [sliding_window_view(s, n) for s in streams if len(s) >= n]
+    if not windows:
+        return np.zeros((0, n), dtype=np.int64), np.zeros(0, dtype=np.int64)
+    grams, counts = np.unique(np.concatenate(windows), axis=0, return_counts=True)
+    return grams, counts
+
+
+class NgramModel:
+    """
+    Character n-gram log-probability table of a reference corpus:
+    log_probs[c1, ..., cn] = log P(cn | c1..c(n-1)) with additive smoothing.
+    Symbol 0 is the word separator.
+    """
+
+    def __init__(self, alphabet, log_probs):
+        self.alphabet = alphabet
+        self.log_probs = log_probs
+        self.n = log_probs.ndim
+
+    @classmethod
+    def from_units(cls, units, n=3, max_symbols=30, smoothing=0.5):
+        letters = Counter(ch for words in units for w in words for ch in w)
+        alphabet = [SPACE] + [ch for ch, _ in letters.most_common(max_symbols - 1)]
+        index = {ch: i for i, ch in enumerate(alphabet)}
+        size = len(alphabet)
+        grams, counts = _count_ngrams(_unit_streams(units, index), n)
+        table = np.full((size,) * n, smoothing, dtype=np.float64)
+        np.add.at(table, tuple(grams.T), counts)
+        table /= table.sum(axis=-1, keepdims=True)
+        return cls(alphabet, np.log(table))
+
+
+class CipherText:
+    """
+    Observed cipher n-grams of a Voynich text in sparse form, plus, for every
+    cipher glyph, the indices of the n-grams that contain it. Changing one key
+    entry only re-scores those n-grams.
+    """
+
+    def __init__(self, glyphs, grams, counts):
+        self.glyphs = glyphs
+        self.grams = grams
+        self.counts = counts.astype(np.float64)
+        self.involves = [np.flatnonzero((grams == g).any(axis=1)) for g in range(len(glyphs))]
+
+    @classmethod
+    def from_units(cls, units, n=3):
+        glyph_counts = Counter(ch for words in units for w in words for ch in w)
+        glyphs = [SPACE] + [ch for ch, _ in glyph_counts.most_common()]
+        index = {ch: i for i, ch in enumerate(glyphs)}
+        grams, counts = _count_ngrams(_unit_streams(units, index), n)
+        return cls(glyphs, grams, counts)
+
+    def score(self, key, log_probs):
+        return float(self.counts @ log_probs[tuple(key[self.grams].T)])
+
+    def decrypt(self, units, key, alphabet, limit=5):
+        index = {ch: i for i, ch in enumerate(self.glyphs)}
+        return [' '.join(''.join(alphabet[key[index[ch]]] for ch in w) for w in words) for words in units[:limit]]
+
+
+def anneal(args):
+    """
+    One simulated-annealing run over homophonic keys (any number of cipher glyphs
+    may map to the same plain symbol; the separator stays fixed).
+    Moves reassign one glyph or swap two; deltas are computed incrementally.
+    Returns (score, key, evaluations).
+    """
+    grams, counts, involves, log_probs, iterations, t_start, t_end, seed = args
+    rng = np.random.default_rng(seed)
+    n_glyphs, n_plain = len(involves), log_probs.shape[0]
+    key = np.concatenate(([0], rng.integers(1, n_plain, n_glyphs - 1)))
+    score = float(counts @ log_probs[tuple(key[grams].T)])
+    best_score, best_key = score, key.copy()
+
+    def partial(key, idx):
+        return counts[idx] @ log_probs[tuple(key[grams[idx]].T)]
+
+    cooling = (t_end / t_start) ** (1.0 / max(iterations - 1, 1))
+    temperature = t_start
+    glyph_moves = rng.integers(1, n_glyphs, size=(iterations, 2))
+    plain_moves = rng.integers(1, n_plain, size=iterations)
+    accept_draws = np.log(rng.random(iterations))
+    swap_moves = rng.random(iterations) < 0.3
+
+    for i in range(iterations):
+        g, h = glyph_moves[i]
+        if swap_moves[i] and g != h and key[g] != key[h]:
+            idx = np.union1d(involves[g], involves[h])
+            before = partial(key, idx)
+            key[g], key[h] = key[h], key[g]
+            delta = partial(key, idx) - before
+            if delta < 0 and accept_draws[i] >= delta / temperature:
+                key[g], key[h] = key[h], key[g]
+            else:
+                score += delta
+        else:
+            old, new = key[g], plain_moves[i]
+            if old == new:
+                temperature *= cooling
+                continue
+            idx = involves[g]
+            before = partial(key, idx)
+            key[g] = new
+            delta = partial(key, idx) - before
+            if delta < 0 and accept_draws[i] >= delta / temperature:
+                key[g] = old
+            else:
+                score += delta
+        if score > best_score:
+            best_score, best_key = score, key.copy()
+        temperature *= cooling
+    return best_score, best_key, iterations
+
+
+def solve(cipher_units, plain_units, n=3, restarts=8, iterations=200000,
+          t_start=10.0, t_end=0.05, workers=None, seed=0, max_symbols=30):
+    """
+    Search homophonic substitution keys from EVA glyphs to a reference alphabet,
+    maximizing the reference n-gram log-likelihood of the decrypted text.
+    Restarts run in parallel across a process pool.
+
+    Args:
+        cipher_units (list): Voynich lines as lists of EVA words.
+        plain_units (list): Reference corpus units as lists of words.
+        n (int): n-gram order of the language model (2-4).
+        restarts (int): Independent annealing runs.
+        iterations (int): Candidate keys evaluated per run.
+        t_start (float): Initial temperature.
+        t_end (float): Final temperature.
+        workers (int): Processes (defaults to all cores).
+        seed (int): Base random seed.
+        max_symbols (int): Size of the reference alphabet, separator included.
+    """
+    model = NgramModel.from_units(plain_units, n=n, max_symbols=max_symbols)
+    cipher = CipherText.from_units(cipher_units, n=n)
+
+    seeds = np.random.SeedSequence(seed).generate_state(restarts)
+    jobs = [(cipher.grams, cipher.counts, cipher.involves, model.log_probs,
+             iterations, t_start, t_end, int(s)) for s in seeds]
+    workers = max(1, min(workers or os.cpu_count() or 1, restarts))
+
+    start = time.perf_counter()
+    if workers == 1:
+        runs = [anneal(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            runs = list(pool.map(anneal, jobs))
+    elapsed = time.perf_counter() - start
+
+    best_score, best_key, _ = max(runs, key=lambda r: r[0])
+    evaluations = sum(r[2] for r in runs)
+    total = cipher.counts.sum()
+    return {
+        "key": {glyph: model.alphabet[best_key[i]] for i, glyph in enumerate(cipher.glyphs) if glyph != SPACE},
+        "score": float(best_score),
+        "log_likelihood_per_ngram": float(best_score / total) if total else 0.0,
+        "restart_scores": sorted((float(r[0]) for r in runs), reverse=True),
+        "evaluations": evaluations,
+        "evaluations_per_minute": evaluations / elapsed * 60 if elapsed else 0.0,
+        "sample": cipher.decrypt(cipher_units, best_key, model.alphabet)
+    }
+
+
+def solve_sections(voynich_path, reference_path, sections=None, transcriber='H', **kwargs):
+    """
+    Run solve() separately for each Voynich section (all sections by default)
+    against one reference corpus. Returns {section: result}.
+    """
+    by_section = {}
+    for rec in iter_takahashi(voynich_path, transcriber):
+        if sections and rec['section'] not in sections:
+            continue
+        words = [w for w in (normalize_token(t) for t in rec['tokens']) if w]
+        if words:
+            by_section.setdefault(rec['section'], []).append(words)
+
+    plain_units = reference_units(reference_path)
+    results = {}
+    for section, units in by_section.items():
+        results[section] = solve(units, plain_units, **kwargs)
+        print(f"{section}: {results[section]['log_likelihood_per_ngram']:.3f} log-prob per n-gram "
+              f"({results[section]['evaluations_per_minute']:,.0f} keys/min)")
+    return results
+
+
+if __name__ == "__main__":
+    result = solve(voynich_units("data/raw/voynich_eva.txt"),
+                   reference_units("data/reference_texts/alchemical_corpora/Greek/language_processed/Hermetica.jsonl"))
+    print(result["key"])
+    print(result["sample"])
@@ -0,0 +1,56 @@
+import shutil
+import subprocess
+import time
+import requests
+
+
+def gpu_available():
+    """True when nvidia-smi is on the PATH and sees at least one GPU."""
+    if shutil.which("nvidia-smi") is None:
+        return False
+    try:
+        result = subprocess.run(["nvidia-smi", "-L"], capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return False
+    return result.returncode == 0 and "GPU" in result.stdout
+
+
+def docker_gpu_args(gpus="auto"):
+    """
+    `docker run` arguments for GPU access: gpus="auto" passes all GPUs if nvidia-smi
+    finds any, "none" runs on CPU, anything else is handed to --gpus as is.
+    """
+    if gpus == "auto":
+        gpus = "all" if gpu_available() else "none"
+    if gpus == "none":
+        print("No GPU requested or found, starting the container on CPU")
+        return []
+    args = ["--gpus", gpus]
+    if gpus == "all":
+        args += ["-e", "NVIDIA_VISIBLE_DEVICES=all"]
+    return args
+
+
+def wait_until_ready(health_url, timeout, start=None):
+    """
+    Poll a service's /health until it reports the model loaded and warmed up (it
+    answers 503 while loading). Returns the health JSON, or None if loading failed
+    or `timeout` seconds passed.
+    """
+    start = start if start is not None else time.perf_counter()
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            response = requests.get(health_url, timeout=2)
+            if response.status_code == 200:
+                ready = response.json()
+                print(f"✅ Ready in {time.perf_counter() - start:.1f}s (model load {ready['model_load_seconds']}s)")
+                return ready
+            if response.json().get("status") == "error":
+                print(f"❌ Model load failed: {response.json().get('error')}")
+                return None
+        except (requests.RequestException, ValueError):
+            pass
+        time.sleep(1)
+    print(f"⏰ Not ready after {timeout}s, giving up on {health_url} (see the container logs below)")
+    return None
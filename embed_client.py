@@ -1,33 +1,148 @@
+import io
+import json
+import struct
+import numpy as np
 import requests
-from typing import List, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Any, Iterator, Tuple
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from embedding_cache import EmbeddingCache
 
 class EmbedderClient:
-    def __init__(self, endpoint: str = "http://localhost:8000/embed", timeout: int = 30):
+    def __init__(self, endpoint: str = "http://localhost:8000/embed", timeout: int = 30,
+                 cache: EmbeddingCache = None, batch_size: int = 64, max_batch_chars: int = 32000,
+                 max_workers: int = 4, max_retries: int = 3, backoff: float = 0.5, binary: bool = False):
         """
         :param endpoint: URL of the embedding service
-        :param timeout: request timeout in seconds
+        :param timeout: request timeout in seconds (per batch)
+        :param cache: optional EmbeddingCache; only texts missing from it are sent to the service
+        :param batch_size: maximum number of texts per request
+        :param max_batch_chars: maximum total characters per request (a longer single text is sent alone)
+        :param max_workers: maximum batches in flight at once
+        :param max_retries: retries per batch on connection errors and 5xx responses
+        :param backoff: exponential backoff factor in seconds between retries
+        :param binary: ask the service for .npy float32 bytes instead of JSON; embed_texts
+                       then returns a float32 NumPy matrix instead of lists of floats
         """
         self.endpoint = endpoint
         self.timeout = timeout
+        self.cache = cache
+        self.batch_size = batch_size
+        self.max_batch_chars = max_batch_chars
+        self.max_workers = max_workers
+        self.binary = binary
+
+        # one keep-alive session, pooled for the concurrent batches
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff,
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=frozenset({"POST"}),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
     def embed_texts(self, texts: List[str]) -> List[List[float]]:
         """
         Send a list of text chunks to the embedding service and return their vectors.
+        With a cache, cached texts are answered locally and new vectors are added to it.
         :param texts: list of cleaned text strings to embed
         :return: list of embedding vectors (each a list of floats)
         """
+        if self.cache is None:
+            return self._request(texts)
+
+        vectors = self.cache.get_many(texts)
+        cached = sum(v is not None for v in vectors)
+        missing = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+        if missing:
+            fresh = self._request(missing)
+            self.cache.put_many(missing, fresh)
+            by_text = dict(zip(missing, fresh))
+            vectors = [by_text[t] if v is None else v for t, v in zip(texts, vectors)]
+        print(f"Embedded {len(missing)} new texts, {cached} of {len(texts)} served from cache")
+        if self.binary:
+            return np.asarray(vectors, dtype=np.float32)
+        return [v if isinstance(v, list) else v.tolist() for v in vectors]
+
+    def embed_records(self, records: List[dict], text_key: str = "text") -> List[dict]:
+        """Attach an 'embedding' to each record from its text (in place) and return the records."""
+        vectors = self.embed_texts([rec[text_key] for rec in records])
+        for rec, vec in zip(records, vectors):
+            rec["embedding"] = vec
+        return records
+
+    def batches(self, texts: List[str]) -> Iterator[Tuple[int, List[str]]]:
+        """Split texts into (start index, batch) by count and by total characters."""
+        start, batch, chars = 0, [], 0
+        for i, text in enumerate(texts):
+            if batch and (len(batch) >= self.batch_size or chars + len(text) > self.max_batch_chars):
+                yield start, batch
+                start, batch, chars = i, [], 0
+            batch.append(text)
+            chars += len(text)
+        if batch:
+            yield start, batch
+
+    def _request(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts in batches, up to max_workers in flight; output order matches input order."""
+        batches = list(self.batches(texts))
+        if len(batches) <= 1 or self.max_workers <= 1:
+            results = [self._post(batch) for _, batch in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                results = list(pool.map(lambda b: self._post(b[1]), batches))
+        if self.binary:
+            return np.concatenate(results) if results else np.zeros((0, 0), dtype=np.float32)
+        vectors = [None] * len(texts)
+        for (start, batch), batch_vectors in zip(batches, results):
+            vectors[start:start + len(batch)] = batch_vectors
+        return vectors
+
+    def _post(self, texts: List[str]) -> List[List[float]]:
         payload = {"texts": texts}
+        headers = {"Accept": "application/x-npy, application/json;q=0.5"} if self.binary else None
         try:
-            resp = requests.post(self.endpoint, json=payload, timeout=self.timeout)
+            resp = self.session.post(self.endpoint, json=payload, timeout=self.timeout, headers=headers)
             resp.raise_for_status()
         except requests.RequestException as e:
             raise RuntimeError(f"Embedding request failed: {e}") from e
 
+        if self.binary:
+            vectors = decode_vectors(resp.headers.get("Content-Type", ""), resp.content)
+            if len(vectors) != len(texts):
+                raise RuntimeError(f"Expected {len(texts)} vectors, got {len(vectors)}")
+            return vectors
+
         data = resp.json()
-        if "vectors" not in data:
-            raise RuntimeError(f"Unexpected response format: {data}")
+        if "vectors" not in data or len(data["vectors"]) != len(texts):
+            raise RuntimeError(f"Unexpected response format: {str(data)[:200]}")
         return data["vectors"]
 
+def decode_vectors(content_type: str, body: bytes) -> np.ndarray:
+    """Decode an /embed response body (.npy, raw float32 with shape header, or JSON) to a float32 matrix."""
+    if content_type.startswith("application/x-npy"):
+        return np.load(io.BytesIO(body), allow_pickle=False)
+    if content_type.startswith("application/octet-stream"):
+        rows, dim = struct.unpack_from("<II", body)
+        return np.frombuffer(body, dtype="<f4", offset=8).reshape(rows, dim)
+    # older services ignore Accept and answer JSON
+    return np.asarray(json.loads(body)["vectors"], dtype=np.float32)
+
 if __name__ == "__main__":
     # Example usage
     client = EmbedderClient()
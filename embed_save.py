@@ -2,17 +2,35 @@ import json
 from pathlib import Path
 from datetime import datetime, timezone
 
-def save_records_with_embeddings(records, output_dir="data/embeddings", prefix="voynich_records_with_embeddings"):
+from embedding_store import save_embedding_store
+
+def save_records_with_embeddings(records, output_dir="data/embeddings", prefix="voynich_records_with_embeddings",
+                                 fmt="jsonl", dtype="float32", cache=None, text_key="text"):
     """
     Save the list of record dicts (each having 'metadata', 'text', and 'embedding')
     to a JSONL file in the specified output directory, with a timezone-aware UTC timestamp.
+    With fmt="store", writes a binary EmbeddingStore directory ("<prefix>_<timestamp>.emb")
+    holding a memory-mappable float32/float16 matrix plus a metadata sidecar instead.
+    With an EmbeddingCache, records lacking an 'embedding' are filled from it and
+    the embeddings being saved are added to it, keyed by their `text_key` text.
     """
+    if cache is not None:
+        for rec in records:
+            if "embedding" not in rec:
+                vec = cache.get(rec[text_key])
+                if vec is None:
+                    raise ValueError(f"No embedding for record and none cached: {rec[text_key][:60]!r}")
+                rec["embedding"] = vec.tolist()
+        cache.put_many([rec[text_key] for rec in records], [rec["embedding"] for rec in records])
+
     # Ensure the directory exists
     out_dir = Path(output_dir)
     out_dir.mkdir(parents=True, exist_ok=True)
     
     # Generate a timezone‐aware UTC timestamp
     timestamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    if fmt == "store":
+        return save_embedding_store(records, out_dir / f"{prefix}_{timestamp}.emb", dtype=dtype)
     filename = f"{prefix}_{timestamp}.jsonl"
     out_path = out_dir / filename
     
@@ -22,3 +40,4 @@ def save_records_with_embeddings(records, output_dir="data/embeddings", prefix="
             f.write(json.dumps(rec, ensure_ascii=False) + "\n")
     
     print(f"Saved {len(records)} records to {out_path}")
+    return out_path
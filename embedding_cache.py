@@ -0,0 +1,87 @@
+import re
+import hashlib
+import unicodedata
+from pathlib import Path
+
+import numpy as np
+
+from embedding_store import EmbeddingStore, EmbeddingStoreWriter, is_embedding_store
+
+CACHE_DIR = "data/embeddings/cache"
+
+
+def normalize_text(text: str) -> str:
+    """Canonical form of a chunk for cache keys: NFC, collapsed whitespace, stripped."""
+    return re.sub(r'\s+', ' ', unicodedata.normalize('NFC', text)).strip()
+
+
+def cache_key(model_id: str, text: str) -> str:
+    return hashlib.sha256(f"{model_id}\x00{normalize_text(text)}".encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed, append-only embedding cache keyed by (model id, normalized text).
+
+    One EmbeddingStore per model under `cache_dir`; each row's metadata holds its key.
+    New vectors are appended, never rewritten, so re-running the pipeline after a
+    small chunking change only embeds the chunks whose text actually changed.
+    """
+
+    def __init__(self, model_id: str = "all-mpnet-base-v2", cache_dir: str = CACHE_DIR, dtype: str = "float32"):
+        self.model_id = model_id
+        safe_name = re.sub(r'[^A-Za-z0-9._-]+', '_', model_id)
+        self.path = Path(cache_dir) / f"{safe_name}.emb"
+        self.dtype = dtype
+        self.hits = 0
+        self.misses = 0
+        self._rows = {}
+        self._store = None
+        if is_embedding_store(self.path):
+            self._store = EmbeddingStore(self.path)
+            for row, meta in enumerate(self._store.records):
+                self._rows[meta["key"]] = row
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, text):
+        return cache_key(self.model_id, text) in self._rows
+
+    def get(self, text):
+        """Cached vector for a text (float32 array) or None."""
+        row = self._rows.get(cache_key(self.model_id, text))
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return np.asarray(self._store.vectors[row], dtype=np.float32)
+
+    def get_many(self, texts):
+        """List of cached vectors (None where missing), in input order."""
+        return [self.get(t) for t in texts]
+
+    def put_many(self, texts, vectors):
+        """Append new (text, vector) pairs; texts already cached are skipped."""
+        new = {}
+        for text, vec in zip(texts, vectors):
+            key = cache_key(self.model_id, text)
+            if key not in self._rows and key not in new:
+                new[key] = np.asarray(vec, dtype=np.float32)
+        if not new:
+            return 0
+        with EmbeddingStoreWriter(self.path, dtype=self.dtype) as writer:
+            for key, vec in new.items():
+                writer.append({"key": key}, vec)
+        # reopen so the memory map covers the appended rows
+        self._store = EmbeddingStore(self.path)
+        start = len(self._store) - len(new)
+        for offset, key in enumerate(new):
+            self._rows[key] = start + offset
+        return len(new)
+
+    def put(self, text, vector):
+        return self.put_many([text], [vector])
+
+    def stats(self) -> dict:
+        return {"entries": len(self), "hits": self.hits, "misses": self.misses, "path": str(self.path)}
@@ -0,0 +1,195 @@
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+HEADER_FILE = "header.json"
+META_FILE = "meta.jsonl"
+DTYPES = {"float32": ".f32", "float16": ".f16"}
+
+
+def is_embedding_store(path) -> bool:
+    return (Path(path) / HEADER_FILE).exists()
+
+
+class EmbeddingStore:
+    """
+    Embedding records kept as a memory-mapped float matrix plus a metadata sidecar.
+
+    Layout of a store directory:
+      header.json    {"dtype": "float32" | "float16", "dim": 768}
+      vectors.f32    raw little-endian matrix, one row per record (vectors.f16 for float16)
+      meta.jsonl     one JSON object per row: the record without its 'embedding'
+
+    Iterating yields records in the usual schema, with 'embedding' being a row
+    view of the memory map (no copy, no JSON parsing).
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path / HEADER_FILE, 'r', encoding='utf-8') as f:
+            header = json.load(f)
+        self.dtype = np.dtype(header["dtype"]).newbyteorder('<')
+        self.dim = int(header["dim"])
+        self.vectors_path = self.path / f"vectors{DTYPES[header['dtype']]}"
+        self._records = None
+        self._vectors = None
+
+    def __len__(self):
+        # derived from the file size so a store stays readable after an interrupted append
+        size = self.vectors_path.stat().st_size if self.vectors_path.exists() else 0
+        return size // (self.dim * self.dtype.itemsize)
+
+    @property
+    def records(self) -> list:
+        """Metadata records (without embeddings), loaded on first access."""
+        if self._records is None:
+            with open(self.path / META_FILE, 'r', encoding='utf-8') as f:
+                self._records = [json.loads(line) for line in f if line.strip()][:len(self)]
+        return self._records
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """(n, dim) read-only memory map of the embedding matrix."""
+        if self._vectors is None:
+            count = len(self)
+            if count == 0:
+                self._vectors = np.zeros((0, self.dim), dtype=self.dtype)
+            else:
+                self._vectors = np.memmap(self.vectors_path, dtype=self.dtype, mode='r', shape=(count, self.dim))
+        return self._vectors
+
+    def __iter__(self):
+        vectors = self.vectors
+        for i, meta in enumerate(self.records):
+            yield {**meta, "embedding": vectors[i]}
+
+    def as_float32(self) -> np.ndarray:
+        """The matrix as float32 (a view for float32 stores, a converted copy for float16)."""
+        return np.asarray(self.vectors, dtype=np.float32)
+
+
+def _truncate_partial_rows(store: EmbeddingStore):
+    """
+    Cut a store back to its last complete row before appending: an interrupted append
+    can leave a partial trailing vector and metadata lines without vectors (or a torn
+    last line), and new rows written after those would be misaligned.
+    """
+    meta_path = store.path / META_FILE
+    ends = []       # byte offset just past each complete metadata line
+    if meta_path.exists():
+        with open(meta_path, 'rb') as f:
+            offset = 0
+            for line in f:
+                offset += len(line)
+                if line.endswith(b"\n"):
+                    ends.append(offset)
+    rows = min(len(store), len(ends))
+    row_bytes = store.dim * store.dtype.itemsize
+    if store.vectors_path.exists() and store.vectors_path.stat().st_size != rows * row_bytes:
+        os.truncate(store.vectors_path, rows * row_bytes)
+    meta_size = ends[rows - 1] if rows else 0
+    if meta_path.exists() and meta_path.stat().st_size != meta_size:
+        os.truncate(meta_path, meta_size)
+
+
+class EmbeddingStoreWriter:
+    """
+    Append-only writer for an EmbeddingStore directory. Creates the store on first
+    use; later writers append to it, after trimming any partial row left by an
+    interrupted append. Use as a context manager.
+    """
+
+    def __init__(self, path, dim: int = None, dtype: str = "float32"):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        if is_embedding_store(self.path):
+            store = EmbeddingStore(self.path)
+            dtype, dim = store.dtype.name, store.dim
+            _truncate_partial_rows(store)
+        self.dtype = dtype
+        self.dim = dim
+        self.count = 0
+        self._vec_file = None
+        self._meta_file = None
+
+    def _open(self, dim):
+        if self.dim is None:
+            self.dim = dim
+        if self.dtype not in DTYPES:
+            raise ValueError(f"Unsupported dtype {self.dtype!r}; expected one of {list(DTYPES)}")
+        if not is_embedding_store(self.path):
+            with open(self.path / HEADER_FILE, 'w', encoding='utf-8') as f:
+                json.dump({"dtype": self.dtype, "dim": self.dim}, f)
+        self._vec_file = open(self.path / f"vectors{DTYPES[self.dtype]}", 'ab')
+        self._meta_file = open(self.path / META_FILE, 'a', encoding='utf-8')
+
+    def append(self, record: dict, vector=None):
+        """Append one record; the vector is taken from record['embedding'] unless given."""
+        if vector is None:
+            vector = record["embedding"]
+        vector = np.asarray(vector, dtype=np.dtype(self.dtype).newbyteorder('<'))
+        if self._vec_file is None:
+            self._open(vector.shape[-1])
+        if vector.shape != (self.dim,):
+            raise ValueError(f"Expected a {self.dim}-dim vector, got shape {vector.shape}")
+        meta = {k: v for k, v in record.items() if k != "embedding"}
+        self._meta_file.write(json.dumps(meta, ensure_ascii=False) + "\n")
+        self._vec_file.write(vector.tobytes())
+        self.count += 1
+
+    def extend(self, records, vectors=None):
+        if vectors is None:
+            for rec in records:
+                self.append(rec)
+        else:
+            for rec, vec in zip(records, vectors):
+                self.append(rec, vec)
+
+    def flush(self):
+        if self._vec_file is not None:
+            # metadata first: readers trust the vector file size for the row count
+            self._meta_file.flush()
+            self._vec_file.flush()
+
+    def close(self):
+        if self._vec_file is not None:
+            self.flush()
+            self._vec_file.close()
+            self._meta_file.close()
+            self._vec_file = self._meta_file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def save_embedding_store(records, path, dtype: str = "float32") -> Path:
+    """Write records (each with an 'embedding') to a new or existing store directory."""
+    with EmbeddingStoreWriter(path, dtype=dtype) as writer:
+        writer.extend(records)
+    print(f"Saved {writer.count} records to {path}")
+    return Path(path)
+
+
+def load_embedding_store(path) -> EmbeddingStore:
+    return EmbeddingStore(path)
+
+
+def convert_jsonl_to_store(jsonl_path, store_path=None, dtype: str = "float32") -> Path:
+    """
+    Convert a JSONL file of records with 'embedding' lists into an EmbeddingStore
+    (by default next to it, with an '.emb' suffix instead of '.jsonl').
+    """
+    jsonl_path = Path(jsonl_path)
+    store_path = Path(store_path) if store_path else jsonl_path.with_suffix(".emb")
+    with EmbeddingStoreWriter(store_path, dtype=dtype) as writer, \
+            open(jsonl_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                writer.append(json.loads(line))
+    print(f"Converted {writer.count} records from {jsonl_path} to {store_path}")
+    return store_path
@@ -0,0 +1,243 @@
+import os
+import json
+import hashlib
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from pre_processing import iter_takahashi
+from vocabulary import TOKENIZER_VERSION, normalize_token
+
+REPORT_PATH = "data/processed/entropy_report.json"
+
+
+# =====================
+# CORPUS LOADING
+# =====================
+
+def voynich_units(file_path, transcriber='H'):
+    """Voynich lines as lists of EVA words (markup removed, see vocabulary.tokenize_eva)."""
+    units = []
+    for rec in iter_takahashi(file_path, transcriber):
+        words = [w for w in (normalize_token(t) for t in rec['tokens']) if w]
+        if words:
+            units.append(words)
+    return units
+
+
+def reference_units(path):
+    """
+    Reference corpus records as lists of words. Accepts the JSONL written by the
+    process_*.py scripts (one {"text": ...} per line) or a chunked JSON list.
+    Words are lowercased and reduced to their letters.
+    """
+    path = Path(path)
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.suffix == '.json':
+            texts = [rec.get('text', '') for rec in json.load(f)]
+        else:
+            texts = [json.loads(line).get('text', '') for line in f if line.strip()]
+    units = []
+    for text in texts:
+        words = [''.join(ch for ch in w.lower() if ch.isalpha()) for w in text.split()]
+        words = [w for w in words if w]
+        if words:
+            units.append(words)
+    return units
+
+
+# =====================
+# MEASUREMENTS
+# =====================
+
+def _entropy(counts):
+    p = counts[counts > 0] / counts.sum()
+    return float(-(p * np.log2(p)).sum())
+
+
+def char_entropies(units):
+    """
+    h0 (log2 of the alphabet size), h1 (single-character entropy) and h2
+    (entropy of a character given the previous one) over the character stream
+    of each unit, words separated by a space.
+    """
+    codes = [np.frombuffer(' '.join(words).encode('utf-32-le'), dtype=np.uint32) for words in units]
+    stream = np.concatenate(codes)
+    alphabet, chars = np.unique(stream, return_inverse=True)
+    size = len(alphabet)
+    # bigrams must not span two units
+    unit_id = np.repeat(np.arange(len(codes)), [len(c) for c in codes])
+    same_unit = unit_id[1:] == unit_id[:-1]
+    first, second = chars[:-1][same_unit], chars[1:][same_unit]
+    pair_counts = np.bincount(first.astype(np.int64) * size + second, minlength=size * size)
+    h_pair = _entropy(pair_counts)
+    h_first = _entropy(np.bincount(first, minlength=size))
+    return {
+        "alphabet_size": int(size),
+        "h0": float(np.log2(size)),
+        "h1": _entropy(np.bincount(chars, minlength=size)),
+        "h2": h_pair - h_first
+    }
+
+
+def word_length_distribution(units, max_length=15):
+    """Share of words of each length 1..max_length (longer words fold into the last bin)."""
+    lengths = np.fromiter((len(w) for words in units for w in words), dtype=np.int64)
+    hist = np.bincount(np.minimum(lengths, max_length), minlength=max_length + 1)[1:]
+    return {
+        "mean": float(lengths.mean()) if len(lengths) else 0.0,
+        "distribution": (hist / max(hist.sum(), 1)).round(6).tolist()
+    }
+
+
+def zipf_fit(units, max_rank=1000):
+    """Least-squares slope of log frequency vs log rank (Zipf exponent is -slope)."""
+    _, counts = np.unique([w for words in units for w in words], return_counts=True)
+    freqs = np.sort(counts)[::-1][:max_rank]
+    ranks = np.arange(1, len(freqs) + 1)
+    if len(freqs) < 2:
+        return {"exponent": 0.0, "r2": 0.0}
+    x, y = np.log(ranks), np.log(freqs)
+    slope, intercept = np.polyfit(x, y, 1)
+    residual = y - (slope * x + intercept)
+    r2 = 1 - residual.var() / y.var() if y.var() else 0.0
+    return {"exponent": float(-slope), "r2": float(r2)}
+
+
+def heaps_fit(units, points=30):
+    """Fit V(n) = K * n ** beta for vocabulary size V after n running words."""
+    words = [w for unit in units for w in unit]
+    if len(words) < 2:
+        return {"K": 0.0, "beta": 0.0}
+    _, first_seen = np.unique(words, return_index=True)
+    new_word = np.zeros(len(words), dtype=np.int64)
+    new_word[first_seen] = 1
+    vocab_growth = np.cumsum(new_word)
+    n = np.unique(np.geomspace(1, len(words), points).astype(np.int64))
+    beta, log_k = np.polyfit(np.log(n), np.log(vocab_growth[n - 1]), 1)
+    return {"K": float(np.exp(log_k)), "beta": float(beta)}
+
+
+def measure(units):
+    return {
+        "units": len(units),
+        "words": sum(len(u) for u in units),
+        "entropy": char_entropies(units),
+        "word_length": word_length_distribution(units),
+        "zipf": zipf_fit(units),
+        "heaps": heaps_fit(units)
+    }
+
+
+def _bootstrap_scalars(units):
+    entropy = char_entropies(units)
+    return {
+        "h1": entropy["h1"],
+        "h2": entropy["h2"],
+        "mean_word_length": word_length_distribution(units)["mean"],
+        "zipf_exponent": zipf_fit(units)["exponent"],
+        "heaps_beta": heaps_fit(units)["beta"]
+    }
+
+
+def _bootstrap_worker(args):
+    units, replicates, seed = args
+    rng = np.random.default_rng(seed)
+    results = []
+    for _ in range(replicates):
+        picks = rng.integers(0, len(units), len(units))
+        results.append(_bootstrap_scalars([units[i] for i in picks]))
+    return results
+
+
+def bootstrap_intervals(units, replicates=200, confidence=0.95, workers=None, seed=0):
+    """
+    Percentile bootstrap confidence intervals (resampling units with replacement)
+    for h1, h2, mean word length, Zipf exponent and Heaps beta.
+    Replicates are split across a process pool.
+    """
+    workers = workers or os.cpu_count() or 1
+    workers = max(1, min(workers, replicates))
+    share = [replicates // workers + (i < replicates % workers) for i in range(workers)]
+    seeds = np.random.SeedSequence(seed).spawn(workers)
+    jobs = [(units, n, s) for n, s in zip(share, seeds) if n]
+
+    if workers == 1:
+        samples = _bootstrap_worker(jobs[0])
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            samples = [r for chunk in pool.map(_bootstrap_worker, jobs) for r in chunk]
+
+    alpha = (1 - confidence) / 2
+    intervals = {}
+    for key in samples[0]:
+        values = np.array([s[key] for s in samples])
+        intervals[key] = [float(np.quantile(values, alpha)), float(np.quantile(values, 1 - alpha))]
+    return intervals
+
+
+# =====================
+# CACHED REPORT
+# =====================
+
+def _fingerprint(paths, params):
+    digest = hashlib.sha256(json.dumps(params, sort_keys=True).encode('utf-8'))
+    for path in paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def build_entropy_report(
+    voynich_path: str,
+    reference_paths: dict,
+    output_path: str = REPORT_PATH,
+    transcriber: str = 'H',
+    replicates: int = 200,
+    workers: int = None,
+    force: bool = False
+) -> dict:
+    """
+    Measure entropy, word lengths and Zipf/Heaps fits for the Voynich text and each
+    reference corpus, with bootstrap confidence intervals, and cache the report as JSON.
+
+    Args:
+        voynich_path (str): Takahashi/EVA interlinear file.
+        reference_paths (dict): {language: path} of process_*.py outputs.
+        output_path (str): Where the JSON report is cached.
+        transcriber (str): Voynich transcriber code.
+        replicates (int): Bootstrap replicates per corpus (0 disables the intervals).
+        workers (int): Processes for the bootstrap (defaults to all cores).
+        force (bool): Recompute even if the cached report matches the inputs.
+    """
+    params = {"transcriber": transcriber, "replicates": replicates, "languages": sorted(reference_paths),
+              "tokenizer": TOKENIZER_VERSION}
+    fingerprint = _fingerprint([voynich_path] + [reference_paths[k] for k in sorted(reference_paths)], params)
+
+    out_path = Path(output_path)
+    if out_path.exists() and not force:
+        with open(out_path, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+        if cached.get("fingerprint") == fingerprint:
+            print(f"Loaded cached entropy report from {out_path}")
+            return cached
+
+    corpora = {"Voynich": voynich_units(voynich_path, transcriber)}
+    for lang, path in reference_paths.items():
+        corpora[lang] = reference_units(path)
+
+    results = {}
+    for name, units in corpora.items():
+        results[name] = measure(units)
+        if replicates:
+            results[name]["bootstrap"] = bootstrap_intervals(units, replicates=replicates, workers=workers)
+        print(f"Measured {name}: h1={results[name]['entropy']['h1']:.3f} h2={results[name]['entropy']['h2']:.3f}")
+
+    report = {"fingerprint": fingerprint, "params": params, "corpora": results}
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(out_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Saved entropy report to {out_path}")
+    return report
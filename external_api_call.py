@@ -38,8 +38,9 @@ format_instr = (
 section_ids = manager.choose_sections(N, include_processed)
 payloads = manager.build_payloads(section_ids, format_instr)
 
-# Call GPT for each
-for p in payloads:
-    print(f"Analyzing section {p['id']}")
-    result = manager.call_openai(p['prompt'], model="gpt-4.1")
-    print(json.dumps(result, indent=2, ensure_ascii=False))
+# Analyze all sections concurrently within the API rate limits
+# (set OPENAI_BASE_URL=http://127.0.0.1:8089/v1 to use openai_stub_server.py offline)
+results = manager.run_analysis(payloads, model="gpt-4.1")
+for r in results:
+    print(f"Section {r['id']}")
+    print(json.dumps(r.get('response', r.get('error')), indent=2, ensure_ascii=False))
@@ -1,10 +1,21 @@
+import hashlib
 import json
 import os
 import random
+import shutil
+import threading
+import time
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
 from pathlib import Path
+import numpy as np
 import openai
 import tiktoken
 
+from embedding_store import HEADER_FILE, EmbeddingStore, convert_jsonl_to_store, is_embedding_store
+from response_cache import ResponseCache, default_cache
+
 # Ensure your OpenAI key is set in the environment
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
@@ -27,25 +38,352 @@ Analyze structural patterns, not linguistic meanings.
 {format_instructions}
 """
 
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+# EmbeddingStore copies of embedding JSONL files (git-ignored, safe to delete)
+STORE_CACHE_DIR = "data/embeddings/cache/stores"
+
+def _store_sidecar(path: Path) -> Path:
+    digest = hashlib.sha256(str(path.resolve()).encode('utf-8')).hexdigest()[:12]
+    return Path(STORE_CACHE_DIR) / f"{path.stem}-{digest}.emb"
+
+def _embedding_store(path: Path):
+    """
+    EmbeddingStore for a store directory, or for a JSONL file through a sidecar store
+    under STORE_CACHE_DIR, converted once (and again whenever the JSONL is newer).
+    None when the sidecar cannot be written or some record has no embedding.
+    """
+    if is_embedding_store(path):
+        return EmbeddingStore(path)
+    sidecar = _store_sidecar(path)
+    try:
+        header = sidecar / HEADER_FILE
+        if not header.exists() or header.stat().st_mtime_ns < path.stat().st_mtime_ns:
+            sidecar.parent.mkdir(parents=True, exist_ok=True)
+            partial = sidecar.with_suffix(".emb.tmp")
+            try:
+                shutil.rmtree(partial, ignore_errors=True)
+                convert_jsonl_to_store(path, partial)
+                shutil.rmtree(sidecar, ignore_errors=True)
+                os.replace(partial, sidecar)
+            finally:
+                shutil.rmtree(partial, ignore_errors=True)
+        return EmbeddingStore(sidecar)
+    except (OSError, KeyError, ValueError) as e:
+        print(f"Not using an embedding store for {path} ({e}); reading the JSONL directly")
+        return None
+
+def _load_embedding_matrix(path: Path) -> np.ndarray:
+    """(n, dim) float32 matrix of the 'embedding' fields in a JSONL file or EmbeddingStore."""
+    store = _embedding_store(path)
+    if store is not None:
+        return store.as_float32()
+    vectors = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                embedding = json.loads(line).get('embedding')
+                if embedding is not None:
+                    vectors.append(embedding)
+    return np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1)
+
+# normalized reference matrices, shared by every manager in the process: path -> (mtime, matrix)
+_REFERENCE_MATRICES = {}
+
+def _reference_matrix(path: Path) -> np.ndarray:
+    stamp = path.stat().st_mtime_ns
+    cached = _REFERENCE_MATRICES.get(path.resolve())
+    if cached is None or cached[0] != stamp:
+        matrix = _load_embedding_matrix(path)
+        cached = _REFERENCE_MATRICES[path.resolve()] = (stamp, _normalize_rows(matrix) if len(matrix) else matrix)
+    return cached[1]
+
+@lru_cache(maxsize=None)
+def _token_encoder(model: str):
+    """tiktoken encoding for a model (cl100k_base for unknown models); None when tiktoken cannot load it."""
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:  # the BPE files are downloaded on first use
+        print(f"tiktoken unavailable for {model} ({e}); estimating 4 characters per token")
+        return None
+
+def count_tokens(text: str, model: str = "gpt-4.1") -> int:
+    enc = _token_encoder(model)
+    return len(enc.encode(text)) if enc is not None else -(-len(text) // 4)
+
+def _parse_content(content: str):
+    try:
+        return json.loads(content)
+    except (json.JSONDecodeError, TypeError):
+        return {"raw_response": content}
+
+class _RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute budgets shared by worker threads, as two
+    token buckets refilled continuously. acquire() blocks until both can pay for a call;
+    defer() holds every caller back after the API reports a rate limit.
+    """
+
+    def __init__(self, rpm: float, tpm: float):
+        self.rpm, self.tpm = rpm, tpm
+        self._requests, self._tokens = float(rpm), float(tpm)
+        self._updated = time.monotonic()
+        self._resume_at = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    def acquire(self, tokens: int) -> float:
+        """Take one request and `tokens` tokens from the budgets; returns the seconds spent waiting."""
+        needed = min(tokens, self.tpm)   # a call larger than the whole budget waits for a full bucket
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                wait = max(self._resume_at - now,
+                           (1 - self._requests) * 60 / self.rpm,
+                           (needed - self._tokens) * 60 / self.tpm)
+                if wait <= 0:
+                    self._requests -= 1
+                    self._tokens -= tokens
+                    return waited
+            time.sleep(wait)
+            waited += wait
+
+    def refund(self, tokens: int):
+        """Give back tokens reserved for a call that used fewer (negative to charge extra)."""
+        with self._lock:
+            self._tokens = min(self.tpm, self._tokens + tokens)
+
+    def defer(self, seconds: float):
+        with self._lock:
+            self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+
+def _retry_after(error) -> float:
+    """Seconds from a rate-limit response's Retry-After / retry-after-ms headers, if any."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+class _SectionPool:
+    """Set of section ids with O(1) add, remove and random pick (swap-remove list + positions)."""
+
+    def __init__(self, ids=()):
+        self.items = []
+        self.positions = {}
+        for sid in ids:
+            self.add(sid)
+
+    def __len__(self):
+        return len(self.items)
+
+    def add(self, sid):
+        if sid not in self.positions:
+            self.positions[sid] = len(self.items)
+            self.items.append(sid)
+
+    def remove(self, sid):
+        pos = self.positions.pop(sid, None)
+        if pos is None:
+            return
+        last = self.items.pop()
+        if pos < len(self.items):
+            self.items[pos] = last
+            self.positions[last] = pos
+
+class _SectionData:
+    """
+    Voynich embedding records of one file, loaded lazily and shared by every manager
+    in the process (one instance per path, replaced when the file changes):
+    metadata on first access, vectors memory-mapped from the EmbeddingStore sidecar,
+    and the section indexes and centroids built on first use.
+    """
+    _shared = {}
+
+    @classmethod
+    def get(cls, path: Path) -> "_SectionData":
+        key = path.resolve()
+        stamp = path.stat().st_mtime_ns
+        data = cls._shared.get(key)
+        if data is None or data.stamp != stamp:
+            data = cls._shared[key] = cls(path, stamp)
+        return data
+
+    def __init__(self, path: Path, stamp: int):
+        self.path = path
+        self.stamp = stamp
+        self._store = None
+        self._records = None
+        self._vectors = None
+        self._indexed = False
+        self._centroids = None
+
+    def _load(self):
+        if self._records is not None:
+            return
+        self._store = _embedding_store(self.path)
+        if self._store is not None:
+            self._records = self._store.records
+        else:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                records = [json.loads(line) for line in f if line.strip()]
+            self._vectors = np.asarray([rec.pop('embedding') for rec in records], dtype=np.float32)
+            self._records = records
+
+    @property
+    def records(self) -> list:
+        """Record metadata (everything but the embedding)."""
+        self._load()
+        return self._records
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """(records, dim) embedding matrix, memory-mapped when backed by a store."""
+        self._load()
+        if self._vectors is None:
+            self._vectors = self._store.vectors
+        return self._vectors
+
+    def index(self) -> "_SectionData":
+        """
+        Section id ("page::paragraph") -> record offsets, in file order, plus secondary
+        indexes of section ids by page and by manuscript section.
+        """
+        if not self._indexed:
+            records = self.records
+            self.section_offsets = {}
+            for i, rec in enumerate(records):
+                self.section_offsets.setdefault(f"{rec['page']}::{rec['paragraph']}", []).append(i)
+            self.section_ids = list(self.section_offsets)
+            self.section_rows = {sid: i for i, sid in enumerate(self.section_ids)}
+            self.page_index, self.section_index = {}, {}
+            for sid, offsets in self.section_offsets.items():
+                rec = records[offsets[0]]
+                self.page_index.setdefault(rec['page'], []).append(sid)
+                self.section_index.setdefault(rec.get('section', 'Unknown'), []).append(sid)
+            self._indexed = True
+        return self
+
+    def centroids(self) -> np.ndarray:
+        """(sections, dim) L2-normalized centroid of each section's normalized row vectors."""
+        if self._centroids is None:
+            self.index()
+            vectors = self.vectors
+            self._centroids = _normalize_rows(np.stack([
+                _normalize_rows(vectors[self.section_offsets[sid]]).mean(axis=0) for sid in self.section_ids]))
+        return self._centroids
+
+class _EmbeddingRecords(Sequence):
+    """Read-only view of the records with their 'embedding' list, built per access from the vectors."""
+
+    def __init__(self, data: "_SectionData"):
+        self._data = data
+
+    def __len__(self):
+        return len(self._data.records)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        rec = dict(self._data.records[i])
+        rec['embedding'] = self._data.vectors[i].tolist()
+        return rec
+
 class VoynichContextManager:
     def __init__(
         self,
         embeddings_path: str,
         reference_paths: dict,
         processed_path: str = "processed_sections.json",
-        responses_path: str = "responses.jsonl"
+        responses_path: str = "responses.jsonl",
+        lazy: bool = True,
+        response_cache: ResponseCache = None
     ):
+        """
+        With lazy=True (default) nothing but the processed list is read here: record
+        metadata loads on first access, embeddings are memory-mapped from an
+        EmbeddingStore copy under STORE_CACHE_DIR (converted from the JSONL once)
+        only when similarity scores or payloads need them, and all managers for the
+        same embeddings file share one loaded copy. lazy=False loads everything now.
+
+        Greedy OpenAI calls go through `response_cache` (the shared default_cache()
+        when None), so re-sending an identical prompt is answered from disk.
+        """
         self.embeddings_path = Path(embeddings_path)
         self.reference_paths = {lang: Path(p) for lang, p in reference_paths.items()}
         self.processed_path = Path(processed_path)
         self.responses_path = Path(responses_path)
-        self.embeddings = self._load_jsonl(self.embeddings_path)
-        self.references = self._load_references(self.reference_paths)
         self.processed = self._load_processed()
+        self._data = _SectionData.get(self.embeddings_path)
+        self._references = None
+        self._unprocessed = None          # filter key -> _SectionPool of unprocessed section ids
+        self._reference_matrix = None     # all reference chunks stacked, L2-normalized
+        self._reference_spans = None      # lang -> (start, end) rows in _reference_matrix
+        self._similarity_cache = {}       # (section id, top_k) -> scores per language
+        self._response_cache = response_cache
+        if not lazy:
+            self._data.index()
+            self._data.vectors
+            self.references
 
-    def _load_jsonl(self, path: Path) -> list:
-        with open(path, 'r', encoding='utf-8') as f:
-            return [json.loads(line) for line in f]
+    @property
+    def response_cache(self) -> ResponseCache:
+        if self._response_cache is None:
+            self._response_cache = default_cache()
+        return self._response_cache
+
+    @property
+    def records(self) -> list:
+        """Voynich record metadata (page, paragraph, section, tokens, raw, ...), without vectors."""
+        return self._data.records
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """(records, dim) embedding matrix aligned with `records`."""
+        return self._data.vectors
+
+    @property
+    def embeddings(self) -> Sequence:
+        """Voynich records as in the embeddings JSONL, 'embedding' included (see records / vectors)."""
+        return _EmbeddingRecords(self._data)
+
+    @property
+    def references(self) -> dict:
+        """Opening excerpt of each reference language."""
+        if self._references is None:
+            self._references = self._load_references(self.reference_paths)
+        return self._references
+
+    @property
+    def section_offsets(self) -> dict:
+        return self._data.index().section_offsets
+
+    @property
+    def section_ids(self) -> list:
+        return self._data.index().section_ids
+
+    @property
+    def page_index(self) -> dict:
+        return self._data.index().page_index
+
+    @property
+    def section_index(self) -> dict:
+        return self._data.index().section_index
 
     def _load_references(self, paths: dict) -> dict:
         refs = {}
@@ -65,19 +403,106 @@ class VoynichContextManager:
         with open(self.processed_path, 'w', encoding='utf-8') as f:
             json.dump(list(self.processed), f, indent=2)
 
-    def choose_sections(self, N: int, include_processed: bool) -> list:
-        all_ids = [f"{rec['page']}::{rec['paragraph']}" for rec in self.embeddings]
-        pool = all_ids if include_processed else [sid for sid in all_ids if sid not in self.processed]
+    def _pools(self) -> dict:
+        """Unprocessed section ids per filter (all, per page, per manuscript section), built on first use."""
+        if self._unprocessed is None:
+            def unprocessed(ids):
+                return _SectionPool(sid for sid in ids if sid not in self.processed)
+            self._unprocessed = {None: unprocessed(self.section_ids)}
+            self._unprocessed.update({("page", k): unprocessed(v) for k, v in self.page_index.items()})
+            self._unprocessed.update({("section", k): unprocessed(v) for k, v in self.section_index.items()})
+        return self._unprocessed
+
+    def section_records(self, sid: str) -> list:
+        """All records (rows) of a section id, in file order."""
+        return [self.records[i] for i in self.section_offsets[sid]]
+
+    def _mark_processed(self, sid: str):
+        self.processed.add(sid)
+        offsets = self.section_offsets.get(sid)
+        if offsets is None:
+            return
+        rec = self.records[offsets[0]]
+        for key in (None, ("page", rec['page']), ("section", rec.get('section', 'Unknown'))):
+            self._pools()[key].remove(sid)
+
+    def choose_sections(self, N: int, include_processed: bool, section: str = None, page: str = None) -> list:
+        """
+        Randomly pick N distinct section ids, optionally only from one manuscript
+        section (e.g. "Herbal") and/or one page. Without include_processed, only
+        sections not processed yet are eligible.
+        """
+        if section is not None and page is not None:
+            # a single page holds few sections: filter it directly
+            pool = [sid for sid in self.page_index.get(page, [])
+                    if self.records[self.section_offsets[sid][0]].get('section', 'Unknown') == section
+                    and (include_processed or sid not in self.processed)]
+        elif include_processed:
+            if section is not None:
+                pool = self.section_index.get(section, [])
+            elif page is not None:
+                pool = self.page_index.get(page, [])
+            else:
+                pool = self.section_ids
+        else:
+            key = ("section", section) if section is not None else ("page", page) if page is not None else None
+            pool = self._pools().get(key, _SectionPool()).items
         if len(pool) < N:
             raise ValueError(f"Not enough sections available ({len(pool)}) for selection of {N} sections.")
         return random.sample(pool, N)
 
+    def _load_similarity_matrices(self):
+        """Stack the (shared, normalized) reference chunk embeddings of every language, once."""
+        if self._reference_matrix is not None:
+            return
+        blocks, spans, start = [], {}, 0
+        for lang, path in self.reference_paths.items():
+            matrix = _reference_matrix(path)
+            if len(matrix) == 0:
+                print(f"No embeddings found for {lang} in {path}; skipping its similarity scores")
+                continue
+            blocks.append(matrix)
+            spans[lang] = (start, start + len(matrix))
+            start += len(matrix)
+        dim = self._data.vectors.shape[1]
+        self._reference_matrix = np.concatenate(blocks) if blocks else np.zeros((0, dim), dtype=np.float32)
+        self._reference_spans = spans
+
+    def section_similarity(self, selected_ids: list, top_k: int = 5, block_size: int = 1024) -> dict:
+        """
+        Cosine similarity of each section to every reference language: max, mean and
+        the top-k scores over that language's chunks. Uncached sections are answered
+        with one matrix multiply per block of `block_size` sections; results are cached.
+        """
+        self._load_similarity_matrices()
+        missing = list(dict.fromkeys(sid for sid in selected_ids if (sid, top_k) not in self._similarity_cache))
+        for start in range(0, len(missing), block_size):
+            block = missing[start:start + block_size]
+            rows = [self._data.section_rows[sid] for sid in block]
+            sims = self._data.centroids()[rows] @ self._reference_matrix.T
+            per_lang = {}
+            for lang, (lo, hi) in self._reference_spans.items():
+                lang_sims = sims[:, lo:hi]
+                k = min(top_k, hi - lo)
+                top = -np.sort(-np.partition(lang_sims, hi - lo - k, axis=1)[:, hi - lo - k:], axis=1)
+                per_lang[lang] = (lang_sims.max(axis=1), lang_sims.mean(axis=1), top)
+            for i, sid in enumerate(block):
+                self._similarity_cache[(sid, top_k)] = {
+                    lang: {
+                        "max": round(float(mx[i]), 4),
+                        "mean": round(float(mean[i]), 4),
+                        f"top_{top_k}": [round(float(v), 4) for v in top[i]]
+                    }
+                    for lang, (mx, mean, top) in per_lang.items()
+                }
+        return {sid: self._similarity_cache[(sid, top_k)] for sid in selected_ids}
+
     def build_payloads(self, selected_ids: list, format_instructions: str) -> list:
         payloads = []
+        similarity = self.section_similarity(selected_ids)
         for sid in selected_ids:
-            page, para = sid.split("::")
-            rec = next(r for r in self.embeddings if r['page'] == page and r['paragraph'] == para)
-            scores = {lang: round(random.random(), 4) for lang in self.references.keys()}
+            rec = self.records[self.section_offsets[sid][0]]
+            scores = similarity[sid]
             context = {
                 "A. Embedding Similarity Metrics": scores,
                 "B. Reference Language Excerpts": self.references,
@@ -88,25 +513,146 @@ class VoynichContextManager:
             }
             prompt = render_template(context, rec['raw'], format_instructions)
             payloads.append({"id": sid, "prompt": prompt})
-            self.processed.add(sid)
+            self._mark_processed(sid)
         self._save_processed()
         return payloads
 
-    def call_openai(self, prompt: str, model: str = "gpt-4.1", temperature: float = 0.0) -> dict:
+    def call_openai(self, prompt: str, model: str = "gpt-4.1", temperature: float = 0.0,
+                    use_cache: bool = True) -> dict:
+        """
+        use_cache=False bypasses the response cache (neither read nor updated). Cache
+        hits are returned without appending to responses.jsonl again.
+        """
+        cache = self.response_cache if use_cache else None
+        content = cache.get("openai", model, temperature, prompt) if cache is not None else None
+        if content is not None:
+            return _parse_content(content)
         response = openai.chat.completions.create(
             model=model,
             messages=[{"role": "user", "content": prompt}],
             temperature=temperature
         )
         content = response.choices[0].message.content
-        try:
-            result = json.loads(content)
-        except json.JSONDecodeError:
-            result = {"raw_response": content}
+        if cache is not None:
+            cache.put("openai", model, temperature, prompt, content)
+        result = _parse_content(content)
         with open(self.responses_path, 'a', encoding='utf-8') as f:
-            f.write(json.dumps({"prompt": prompt, "response": result}, ensure_ascii=False) + "\n")
+            f.write(json.dumps({"prompt": prompt, "response": result, "model": model, "temperature": temperature},
+                               ensure_ascii=False) + "\n")
         return result
 
+    def run_analysis(
+        self,
+        payloads: list,
+        model: str = "gpt-4.1",
+        temperature: float = 0.0,
+        max_workers: int = 8,
+        rpm: float = 500,
+        tpm: float = 30000,
+        output_tokens: int = 1000,
+        max_retries: int = 6,
+        base_url: str = None,
+        timeout: float = 120.0,
+        use_cache: bool = True
+    ) -> list:
+        """
+        Send build_payloads() prompts concurrently, within `rpm` requests and `tpm`
+        tokens per minute (each call reserves its tiktoken prompt count plus
+        `output_tokens`, and the unused part is refunded from the reported usage).
+        Rate-limit, timeout, connection and 5xx errors are retried with exponential
+        backoff, honouring Retry-After. New responses are appended to responses.jsonl
+        as they complete through one buffered writer, as {"id", "prompt", "response",
+        "model", "temperature"}; cache hits are not logged again.
+
+        base_url points the client at another OpenAI-compatible endpoint, e.g. the
+        offline stub in openai_stub_server.py (OPENAI_BASE_URL works too). Prompts
+        already in the response cache are answered without a request unless
+        use_cache=False.
+
+        Returns [{"id", "response", "cached"} or {"id", "error"}] in payload order.
+        """
+        base_url = base_url or os.getenv("OPENAI_BASE_URL")
+        api_key = openai.api_key or os.getenv("OPENAI_API_KEY") or ("stub" if base_url else None)
+        client = openai.OpenAI(api_key=api_key, base_url=base_url, timeout=timeout, max_retries=0)
+        limiter = _RateLimiter(rpm, tpm)
+        _token_encoder(model)
+        retryable = (openai.RateLimitError, openai.APITimeoutError,
+                     openai.APIConnectionError, openai.InternalServerError)
+        cache = self.response_cache if use_cache else None
+        stats = {"retries": 0, "rate_limited": 0, "throttled_seconds": 0.0, "tokens": 0, "cached": 0}   # throttled: summed over workers
+        stats_lock = threading.Lock()
+
+        def analyze(payload):
+            content = cache.get("openai", model, temperature, payload["prompt"]) if cache is not None else None
+            if content is not None:
+                with stats_lock:
+                    stats["cached"] += 1
+                return _parse_content(content), True
+            reserved = count_tokens(payload["prompt"], model) + output_tokens
+            for attempt in range(max_retries + 1):
+                waited = limiter.acquire(reserved)
+                try:
+                    response = client.chat.completions.create(
+                        model=model,
+                        messages=[{"role": "user", "content": payload["prompt"]}],
+                        temperature=temperature
+                    )
+                except retryable as e:
+                    # a failed attempt consumed no tokens; give the reservation back before waiting
+                    limiter.refund(reserved)
+                    if attempt == max_retries:
+                        raise
+                    delay = _retry_after(e) or min(60.0, 2 ** attempt) * random.uniform(0.5, 1.5)
+                    if isinstance(e, openai.RateLimitError):
+                        limiter.defer(delay)
+                    with stats_lock:
+                        stats["retries"] += 1
+                        stats["rate_limited"] += isinstance(e, openai.RateLimitError)
+                        stats["throttled_seconds"] += waited
+                    print(f"Retrying section {payload['id']} in {delay:.1f}s ({type(e).__name__})")
+                    time.sleep(delay)
+                    continue
+                except Exception:
+                    limiter.refund(reserved)
+                    raise
+                used = getattr(response.usage, "total_tokens", None) or reserved
+                limiter.refund(reserved - used)
+                with stats_lock:
+                    stats["throttled_seconds"] += waited
+                    stats["tokens"] += used
+                content = response.choices[0].message.content
+                if cache is not None:
+                    cache.put("openai", model, temperature, payload["prompt"], content)
+                return _parse_content(content), False
+
+        results = [None] * len(payloads)
+        start = time.perf_counter()
+        self.responses_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.responses_path, 'a', encoding='utf-8', buffering=1 << 16) as out, \
+                ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {pool.submit(analyze, p): i for i, p in enumerate(payloads)}
+            for future in as_completed(futures):
+                i = futures[future]
+                payload = payloads[i]
+                try:
+                    result, cached = future.result()
+                except Exception as e:
+                    print(f"Section {payload['id']} failed: {e}")
+                    results[i] = {"id": payload["id"], "error": str(e)}
+                    continue
+                results[i] = {"id": payload["id"], "response": result, "cached": cached}
+                if cached:
+                    continue    # already logged when it was first answered
+                out.write(json.dumps({"id": payload["id"], "prompt": payload["prompt"], "response": result,
+                                      "model": model, "temperature": temperature}, ensure_ascii=False) + "\n")
+        elapsed = time.perf_counter() - start
+        failed = sum("error" in r for r in results)
+        print(f"Analyzed {len(payloads) - failed}/{len(payloads)} sections in {elapsed:.1f}s "
+              f"({len(payloads) / elapsed if elapsed else 0:.1f} req/s, {stats['cached']} cached, {stats['tokens']} tokens, "
+              f"{stats['retries']} retries, {stats['rate_limited']} rate-limited, "
+              f"{stats['throttled_seconds']:.1f}s throttled)")
+        return results
+
     def show_responses(self, max_items: int = 5):
         if not self.responses_path.exists():
             print("No responses found.")
@@ -144,11 +690,7 @@ class VoynichContextManager:
             data = [json.loads(line)["response"] for line in f if line.strip()]
         summary = json.dumps(data, ensure_ascii=False)
         prompt = f"Summary of analyses:\n{summary}\nTask: refine the hypothesis."  
-        try:
-            enc = tiktoken.encoding_for_model(model)
-        except KeyError:
-            enc = tiktoken.get_encoding("cl100k_base")
-        input_tokens = len(enc.encode(prompt))
+        input_tokens = count_tokens(prompt, model)
         output_tokens = int(input_tokens * output_multiplier)
         total_tokens = rounds * (input_tokens + output_tokens)
         return {
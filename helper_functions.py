@@ -9,6 +9,8 @@ import json
 import re
 import os
 
+from embedding_store import is_embedding_store, load_embedding_store
+
 # =====================
 # CONFIGURATION SECTION
 # =====================
@@ -60,7 +62,11 @@ OUTPUT_FILENAME = "voynich_language_comparison.png"
 def load_embeddings(path, source_name):
     records = []
     try:
-        if os.path.exists(path):
+        if is_embedding_store(path):
+            # memory-mapped vectors: each 'embedding' is a row view, nothing is parsed
+            records = list(load_embedding_store(path))
+            print(f"Loaded {len(records)} records from {source_name}")
+        elif os.path.exists(path):
             with open(path, "r", encoding="utf-8") as f:
                 for line in f:
                     try:
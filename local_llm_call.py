@@ -2,7 +2,16 @@ import requests
 import time
 import os
 import json
+import glob
+import uuid
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+    import fcntl
+from response_cache import default_cache
 
 def llm_call_old(prompt, max_tokens=300):
     url = "http://localhost:8001/generate"
@@ -32,21 +41,57 @@ def llm_call_old(prompt, max_tokens=300):
         print(f"🚫 Connection failed: {str(e)}")
         return 0
 
-def llm_call(prompt, max_tokens=300):
+_service_models = {}
+
+def service_model(url="http://localhost:8001/generate"):
+    """
+    Model the LLM service at `url` has loaded (from /health), used in response cache
+    keys. When the service is unreachable or still loading, falls back to the last
+    model seen, so cached completions stay available offline.
+    """
+    if url not in _service_models:
+        try:
+            health = requests.get(url.rsplit("/", 1)[0] + "/health", timeout=5).json()
+        except (requests.RequestException, ValueError):
+            health = {}
+        if health.get("status") != "ready":
+            return health.get("model") or default_cache().latest_model("local") or "unknown"
+        _service_models[url] = health["model"]
+    return _service_models[url]
+
+def llm_call(prompt, max_tokens=300, timeout=(10, 900), temperature=None, use_cache=True):
+    """
+    Generate with the local LLM service. By default the service samples with its
+    own temperature (0.7). Pass temperature=0.0 for greedy decoding: a prompt
+    already answered by the same model with the same max_tokens then comes from
+    the persistent response cache (use_cache=False bypasses it). Sampled calls
+    are never cached.
+    """
     url = "http://localhost:8001/generate"
     payload = {
         "prompt": prompt,
         "max_new_tokens": max_tokens
     }
+    if temperature is not None:
+        payload["temperature"] = temperature
 
     try:
         start = time.perf_counter()
-        response = requests.post(url, json=payload)
+        cache = default_cache() if use_cache and temperature is not None else None
+        if cache is not None and cache.cacheable(temperature):
+            model, params = service_model(url), {"max_new_tokens": max_tokens}
+            cached = cache.get("local", model, temperature, prompt, params)
+            if cached is not None:
+                print(f"✅ Cached response in {time.perf_counter() - start:.3f}s")
+                return cached
+        response = requests.post(url, json=payload, timeout=timeout)
         response_time = time.perf_counter() - start
 
         if response.status_code == 200:
             result = response.json()
             response_text = result.get('response', '')
+            if cache is not None and cache.cacheable(temperature):
+                cache.put("local", model, temperature, prompt, response_text, params)
             print(f"✅ Response in {response_time:.2f}s | Tokens: {max_tokens}")
             print("Generated text:")
             print("-" * 80)
@@ -60,6 +105,154 @@ def llm_call(prompt, max_tokens=300):
         print(f"🚫 Connection failed: {str(e)}")
         return ""
 
+def is_degenerate(text, max_period=80, min_repeats=4, min_span=60):
+    """True when the tail of the text is one short unit repeated (a looping generation)."""
+    for period in range(1, max_period + 1):
+        repeats = max(min_repeats, -(-min_span // period))
+        if len(text) < period * repeats:
+            break
+        unit = text[-period:]
+        if unit.strip() and text.endswith(unit * repeats):
+            return True
+    return False
+
+def _try_lock(f):
+    """Non-blocking exclusive OS lock on an open file; False if another handle holds it.
+    The lock goes away with the handle, including when the process is killed."""
+    try:
+        if msvcrt:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    return True
+
+def recover_partial_responses(output_folder, file_name="llm_responses.jsonl", stale_after=60):
+    """
+    Append the output of streams whose process died mid-generation (left in
+    '<file_name>.<id>.partial' files by llm_stream) as partial records, then
+    remove those files. A live stream holds a lock on its file, so files that
+    cannot be locked are skipped. Returns the number of records recovered.
+    """
+    recovered = 0
+    for path in glob.glob(os.path.join(glob.escape(output_folder), f"{glob.escape(file_name)}.*.partial")):
+        try:
+            f = open(path, 'r', encoding='utf-8')
+        except FileNotFoundError:
+            continue  # finished meanwhile
+        with f:
+            if not _try_lock(f):
+                continue  # still streaming
+            f.seek(0)
+            header = f.readline()
+            text = f.read()
+        if not header.endswith("\n"):
+            # not written yet, or already appended by its stream; only clear out old ones
+            if time.time() - os.path.getmtime(path) > stale_after:
+                os.remove(path)
+            continue
+        header = json.loads(header)
+        append_llm_response(text.strip(), header.get("prompt", ""), output_folder, file_name, {
+            **header.get("metadata", {}),
+            "finish_reason": "interrupted",
+            "partial": True
+        })
+        os.remove(path)
+        recovered += 1
+    return recovered
+
+def llm_stream(prompt, max_tokens=300, timeout=(10, 120), output_folder=None,
+               file_name="llm_responses.jsonl", metadata=None, abort_on_degenerate=True,
+               url="http://localhost:8001/generate"):
+    """
+    Stream a generation from the LLM service, yielding text pieces as they arrive.
+
+    Args:
+        prompt (str): The input prompt text.
+        max_tokens (int): Maximum new tokens.
+        timeout (tuple): (connect, read) seconds; read is the longest allowed gap between tokens.
+        output_folder (str): If set, every piece is written and flushed to a
+            '<file_name>.<id>.partial' file as it arrives, and the (possibly partial)
+            output is appended with append_llm_response when the stream ends, fails
+            or is abandoned. If the process is killed instead, the next llm_stream
+            into the same folder (or recover_partial_responses) appends it.
+        file_name (str): JSONL file inside output_folder.
+        metadata (dict): Optional metadata; the finish reason and timings are added.
+        abort_on_degenerate (bool): Stop when the output starts looping (see is_degenerate).
+    """
+    payload = {"prompt": prompt, "max_new_tokens": max_tokens, "stream": True}
+    parts, finish_reason, first_token = [], None, None
+    partial, partial_path = None, None
+    if output_folder:
+        os.makedirs(output_folder, exist_ok=True)
+        recover_partial_responses(output_folder, file_name)
+        partial_path = os.path.join(output_folder, f"{file_name}.{uuid.uuid4().hex}.partial")
+        partial = open(partial_path, 'x', encoding='utf-8')
+        _try_lock(partial)
+        partial.write(json.dumps({"prompt": prompt, "metadata": metadata or {},
+                                  "started": datetime.utcnow().isoformat()}, ensure_ascii=False) + "\n")
+        partial.flush()
+    start = time.perf_counter()
+    try:
+        with requests.post(url, json=payload, stream=True, timeout=timeout) as response:
+            if response.status_code != 200:
+                finish_reason = f"http_{response.status_code}"
+                print(f"❌ Error {response.status_code}: {response.text}")
+                return
+            for line in response.iter_lines(decode_unicode=True):
+                if not line:
+                    continue
+                event = json.loads(line)
+                if "error" in event:
+                    finish_reason = "error"
+                    print(f"❌ Generation failed: {event['error']}")
+                    return
+                if event.get("done"):
+                    finish_reason = event.get("finish_reason")
+                    return
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+                parts.append(event["token"])
+                if partial:
+                    partial.write(event["token"])
+                    partial.flush()
+                yield event["token"]
+                if abort_on_degenerate and is_degenerate("".join(parts[-200:])):
+                    finish_reason = "degenerate"
+                    print("\n⚠️ Aborting: output is repeating itself")
+                    return
+    except requests.RequestException as e:
+        finish_reason = "connection_error"
+        print(f"🚫 Connection failed: {str(e)}")
+    finally:
+        finish_reason = finish_reason or "abandoned"
+        elapsed = time.perf_counter() - start
+        ttft = f"{first_token:.2f}s" if first_token is not None else "n/a"
+        print(f"\n✅ Stream ended ({finish_reason}) in {elapsed:.2f}s | first token after {ttft}")
+        if output_folder:
+            append_llm_response("".join(parts).strip(), prompt, output_folder, file_name, {
+                **(metadata or {}),
+                "finish_reason": finish_reason,
+                "partial": finish_reason not in ("stop", "length"),
+                "time_to_first_token": first_token,
+                "elapsed": elapsed
+            })
+            # empty it before the lock goes, so recovery cannot append it a second time
+            partial.seek(0)
+            partial.truncate()
+            partial.close()
+            os.remove(partial_path)
+
+def llm_call_many(prompts, max_tokens=300, max_workers=4):
+    """
+    Send several prompts at once (e.g. one per language in data/prompts/) so the
+    service's scheduler can batch them. Returns the responses in prompt order.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(lambda p: llm_call(p, max_tokens), prompts))
+
 def save_llm_response(response_text: str,
                       prompt_text: str,
                       output_folder: str,
@@ -0,0 +1,183 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from vocabulary import encode_corpus
+
+
+class NgramCounts:
+    """
+    Counts of the distinct n-grams of one kind ('glyph' or 'word').
+    `grams` is an (k, n) int32 array of ids, `counts` the matching int64 counts,
+    sorted by decreasing count.
+    """
+
+    def __init__(self, kind, n, grams, counts, vocab):
+        order = np.argsort(-counts, kind='stable')
+        self.kind = kind
+        self.n = n
+        self.grams = grams[order]
+        self.counts = counts[order]
+        self.vocab = vocab
+
+    def __len__(self):
+        return len(self.counts)
+
+    @property
+    def total(self):
+        return int(self.counts.sum())
+
+    def label(self, gram):
+        if self.kind == 'glyph':
+            return self.vocab.decode_glyphs(gram)
+        return ' '.join(self.vocab.decode_words(gram))
+
+    def most_common(self, k=None):
+        """[(label, count), ...] for the k most frequent n-grams."""
+        k = len(self) if k is None else k
+        return [(self.label(g), int(c)) for g, c in zip(self.grams[:k], self.counts[:k])]
+
+    def frequencies(self):
+        return self.counts / max(self.total, 1)
+
+    def to_dict(self, k=None):
+        return dict(self.most_common(k))
+
+
+def _count_rows(rows, base):
+    """
+    Count distinct rows of an (m, n) int array whose values are < base.
+    Rows are packed into int64 keys when base ** n fits, otherwise sorted lexicographically.
+    Returns (distinct_rows, counts).
+    """
+    m, n = rows.shape
+    if m == 0:
+        return rows.reshape(0, n).astype(np.int32), np.zeros(0, dtype=np.int64)
+    if base ** n < 2 ** 63:
+        powers = base ** np.arange(n - 1, -1, -1, dtype=np.int64)
+        keys, counts = np.unique(rows.astype(np.int64) @ powers, return_counts=True)
+        distinct = (keys[:, None] // powers) % base
+        return distinct.astype(np.int32), counts.astype(np.int64)
+    order = np.lexsort(rows.T[::-1])
+    sorted_rows = rows[order]
+    starts = np.concatenate(([0], np.flatnonzero(np.any(np.diff(sorted_rows, axis=0) != 0, axis=1)) + 1))
+    counts = np.diff(np.concatenate((starts, [m])))
+    return sorted_rows[starts].astype(np.int32), counts.astype(np.int64)
+
+
+def _windows(ids, segments, n):
+    """All length-n windows of ids that stay inside one segment, plus each window's segment."""
+    if len(ids) < n:
+        return np.zeros((0, n), dtype=ids.dtype), np.zeros(0, dtype=segments.dtype)
+    windows = sliding_window_view(ids, n)
+    valid = segments[:len(windows)] == segments[n - 1:]
+    return windows[valid], segments[:len(windows)][valid]
+
+
+def _sequences(corpus, kind, line_mask=None):
+    """(ids, segment per id, alphabet size, line of each id) for glyph or word n-grams."""
+    word_line = corpus.word_line()
+    if kind == 'glyph':
+        glyph_word = corpus.glyph_word()
+        ids, segments, base = corpus.glyph_ids, glyph_word, len(corpus.vocab.glyphs)
+        lines = word_line[glyph_word]
+    elif kind == 'word':
+        ids, segments, base = corpus.word_ids, word_line, len(corpus.vocab.words)
+        lines = word_line
+    else:
+        raise ValueError(f"Unknown n-gram kind: {kind!r} (expected 'glyph' or 'word')")
+    if line_mask is not None:
+        keep = line_mask[lines]
+        ids, segments, lines = ids[keep], segments[keep], lines[keep]
+    return ids, segments, max(base, 1), lines
+
+
+def ngram_counts(corpus, kind='glyph', n=1, line_mask=None):
+    """
+    Count glyph n-grams (within words) or word n-grams (within lines).
+    `line_mask` optionally restricts counting to a subset of lines
+    (see EncodedCorpus.lines_where).
+    """
+    ids, segments, base, _ = _sequences(corpus, kind, line_mask)
+    windows, _ = _windows(ids, segments, n)
+    grams, counts = _count_rows(windows, base)
+    return NgramCounts(kind, n, grams, counts, corpus.vocab)
+
+
+def section_ngram_counts(corpus, kind='glyph', n=1, line_mask=None):
+    """
+    Per-section n-gram counts in one batched pass: windows are tagged with
+    their section code and counted together, then split by section.
+    Returns {section: NgramCounts}.
+    """
+    ids, segments, base, lines = _sequences(corpus, kind, line_mask)
+    windows, window_segments = _windows(ids, segments, n)
+    # the segment (word or line) of a window determines its line, hence its section
+    if kind == 'glyph':
+        window_lines = corpus.word_line()[window_segments]
+    else:
+        window_lines = window_segments
+    sections = corpus.line_section[window_lines]
+    tagged = np.column_stack((sections, windows))
+    rows, counts = _count_rows(tagged, max(base, len(corpus.sections)))
+    result = {}
+    for code, name in enumerate(corpus.sections):
+        mask = rows[:, 0] == code
+        if mask.any():
+            result[name] = NgramCounts(kind, n, rows[mask, 1:], counts[mask], corpus.vocab)
+    return result
+
+
+def positional_glyph_counts(corpus, line_mask=None):
+    """
+    Glyph frequencies by position in the word: 'initial', 'medial' and 'final'.
+    A one-glyph word counts as both initial and final.
+    Returns {position: int64 array indexed by glyph id}.
+    """
+    offsets = corpus.word_offsets
+    lengths = np.diff(offsets)
+    words = lengths > 0
+    if line_mask is not None:
+        words &= line_mask[corpus.word_line()]
+    starts, ends = offsets[:-1][words], offsets[1:][words]
+    size = len(corpus.vocab.glyphs)
+
+    initial = np.bincount(corpus.glyph_ids[starts], minlength=size)
+    final = np.bincount(corpus.glyph_ids[ends - 1], minlength=size)
+    in_word = np.zeros(len(corpus.glyph_ids), dtype=bool)
+    in_word[np.repeat(words, lengths)] = True
+    # medial = every glyph of a selected word minus its first and last
+    medial_mask = in_word.copy()
+    medial_mask[starts] = False
+    medial_mask[ends - 1] = False
+    medial = np.bincount(corpus.glyph_ids[medial_mask], minlength=size)
+    return {"initial": initial, "medial": medial, "final": final}
+
+
+def ngram_profile(corpus, max_n=5, top=25, by_section=True):
+    """
+    Glyph and word 1..max_n-gram statistics for an EncodedCorpus (or records /
+    RecordStore, which are encoded first). Returns a JSON-serializable dict with
+    totals, distinct counts and the `top` most frequent n-grams, positional glyph
+    frequencies and, optionally, the same n-gram tables per section.
+    """
+    if not hasattr(corpus, 'glyph_ids'):
+        corpus = encode_corpus(corpus)
+
+    def summarize(counts):
+        return {"total": counts.total, "distinct": len(counts), "top": counts.most_common(top)}
+
+    profile = {"glyph": {}, "word": {}, "positional_glyphs": {}, "sections": {}}
+    for kind in ("glyph", "word"):
+        for n in range(1, max_n + 1):
+            profile[kind][n] = summarize(ngram_counts(corpus, kind, n))
+            if by_section:
+                for section, counts in section_ngram_counts(corpus, kind, n).items():
+                    profile["sections"].setdefault(section, {"glyph": {}, "word": {}})[kind][n] = summarize(counts)
+
+    for position, counts in positional_glyph_counts(corpus).items():
+        total = max(int(counts.sum()), 1)
+        order = np.argsort(-counts, kind='stable')[:top]
+        profile["positional_glyphs"][position] = [
+            (corpus.vocab.glyphs[g], int(counts[g]), round(float(counts[g]) / total, 6)) for g in order if counts[g]
+        ]
+    return profile
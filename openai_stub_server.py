@@ -0,0 +1,126 @@
+"""
+Offline stand-in for the OpenAI chat completions API, for testing
+VoynichContextManager.run_analysis throughput without a key or network.
+
+    python openai_stub_server.py --port 8089 --latency 0.5 --rpm 120
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 python external_api_call.py
+
+POST /v1/chat/completions answers every prompt with a fixed JSON analysis after
+`latency` seconds, reporting approximate token usage. With --rpm, requests past
+that many in the last 60 seconds get a 429 with Retry-After, like the real API.
+"""
+import argparse
+import json
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STUB_ANALYSIS = {
+    "token_structure_analysis": "stub response",
+    "possible_function": "stub response",
+    "delimiter_notes": "stub response",
+    "confidence": 0.0
+}
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        server = self.server
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+
+        retry_after = server.admit()
+        if retry_after is not None:
+            self._send(429, {"error": {"message": "Rate limit reached for requests (stub)",
+                                       "type": "requests", "code": "rate_limit_exceeded"}},
+                       {"Retry-After": f"{retry_after:.3f}"})
+            return
+
+        time.sleep(server.latency)
+        content = json.dumps(server.analysis, ensure_ascii=False)
+        prompt_tokens = sum(len(m.get("content") or "") for m in request.get("messages", [])) // 4
+        completion_tokens = len(content) // 4
+        self._send(200, {
+            "id": f"chatcmpl-stub-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens}
+        })
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, latency: float = 0.5, rpm: int = None, analysis: dict = None):
+        super().__init__(address, _StubHandler)
+        self.latency = latency
+        self.rpm = rpm
+        self.analysis = analysis or STUB_ANALYSIS
+        self.served = 0
+        self.rejected = 0
+        self._recent = deque()
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def admit(self):
+        """None if the request is within the rpm limit, else seconds until it would be."""
+        with self._lock:
+            now = time.monotonic()
+            while self._recent and now - self._recent[0] >= 60:
+                self._recent.popleft()
+            if self.rpm and len(self._recent) >= self.rpm:
+                self.rejected += 1
+                return 60 - (now - self._recent[0])
+            self._recent.append(now)
+            self.served += 1
+            return None
+
+
+def start_stub_server(port: int = 0, latency: float = 0.5, rpm: int = None,
+                      host: str = "127.0.0.1") -> StubServer:
+    """Serve on a background thread (port 0 picks a free one); pass server.base_url to run_analysis."""
+    server = StubServer((host, port), latency=latency, rpm=rpm)
+    threading.Thread(target=server.serve_forever, name="openai-stub", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline OpenAI chat completions stub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds per completion")
+    parser.add_argument("--rpm", type=int, default=None, help="answer 429 past this many requests per minute")
+    args = parser.parse_args()
+
+    server = StubServer((args.host, args.port), latency=args.latency, rpm=args.rpm)
+    print(f"OpenAI stub listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"Served {server.served} completions, rejected {server.rejected}")
@@ -1,6 +1,9 @@
 import re
 from collections import defaultdict
 
+from record_store import RecordStore, chunk_page
+from vocabulary import tokenize_eva
+
 # Section mapping dictionary
 SECTION_MAP = {
     'T': 'Text',
@@ -13,45 +16,38 @@ SECTION_MAP = {
     'S': 'Stars'
 }
 
-def preprocess_takahashi(file_path, transcriber='H'):
+def iter_takahashi(file_path, transcriber='H'):
     """
-    Parse a Takahashi transcription file and extract records for a given transcriber.
-    Returns a list of dicts with metadata and cleaned text tokens.
-    Includes section information based on folio metadata.
+    Stream a Takahashi transcription file and lazily yield records for a given transcriber.
+    Single pass: the section of each page is resolved from the folio header
+    (e.g. "<f1v> {$I=H ...}") seen before its transcription lines.
+    Yields the same record dicts as preprocess_takahashi.
+    `transcriber` may be a single code ('H'), a collection of codes (['H', 'C'])
+    or None for every transcriber in the file.
     """
-    # First pass: Extract folio-section mappings
     section_mapping = {}
     section_pattern = re.compile(r'<([^>]+)>\s*\{\$I=([A-Z])')
-    
-    with open(file_path, 'r', encoding='latin1') as f:
-        for line in f:
-            line = line.strip()
-            # Skip lines that aren't section declarations
-            if not line.startswith('<') or '{$I=' not in line:
-                continue
-                
-            # Extract folio and section code
-            match = section_pattern.search(line)
-            if match:
-                folio = match.group(1)  # e.g., "f1v"
-                section_code = match.group(2)  # e.g., "H"
-                section_mapping[folio] = SECTION_MAP.get(section_code, 'Unknown')
-    
-    # Second pass: Process transcription lines
-    records = []
     prefix_pattern = re.compile(r'<([^;>]+);([^>]+)>')
-    
+    if isinstance(transcriber, str):
+        tag, wanted = f';{transcriber}>', None
+    else:
+        tag, wanted = '', None if transcriber is None else set(transcriber)
+
     with open(file_path, 'r', encoding='latin1') as f:
         for line in f:
             line = line.strip()
-            # 1) skip blank lines
-            if not line:
+            # 1) skip blank lines, pure comments and anything that is not a locator line
+            if not line.startswith('<'):
                 continue
-            # 2) skip pure comments
-            if line.startswith('#') or line.startswith('##'):
+            # 2) folio header: remember its section for the lines that follow
+            if '{$I=' in line:
+                match = section_pattern.search(line)
+                if match:
+                    folio, section_code = match.groups()  # e.g. "f1v", "H"
+                    section_mapping[folio] = SECTION_MAP.get(section_code, 'Unknown')
                 continue
-            # 3) only process lines that start with '<' AND contain your transcriber tag
-            if not line.startswith('<') or f';{transcriber}>' not in line:
+            # 3) only process lines that contain your transcriber tag
+            if tag not in line:
                 continue
 
             # Extract prefix and transcription text
@@ -59,66 +55,170 @@ def preprocess_takahashi(file_path, transcriber='H'):
             if not m:
                 continue
             locator, tx_id = m.groups()
+            if wanted is not None and tx_id not in wanted:
+                continue
             page, para, row = locator.split('.')  # e.g. f1r, P2, 9
 
             # Everything after the first '>' is the raw transcription
             raw = line.split('>', 1)[1].strip()
 
-            # Clean & tokenize
+            # Clean & tokenize (markup such as {plant}, '!' or '=' never reaches the tokens)
             cleaned = raw.replace('.', ' ')
-            tokens = [w.rstrip('-').rstrip('?') for w in cleaned.split()]
-            
-            # Get section from mapping (default to 'Unknown')
-            section = section_mapping.get(page, 'Unknown')
+            tokens = tokenize_eva(raw)
 
-            records.append({
+            yield {
                 'page': page,
                 'paragraph': para,
                 'row': row,
                 'transcriber': tx_id,
-                'section': section,  # NEW FIELD
+                'section': section_mapping.get(page, 'Unknown'),
                 'raw': cleaned,
                 'tokens': tokens
-            })
+            }
 
-    return records
+
+def preprocess_takahashi(file_path, transcriber='H', stream=False):
+    """
+    Parse a Takahashi transcription file and extract records for a given transcriber.
+    Returns a list of dicts with metadata and cleaned text tokens.
+    Includes section information based on folio metadata.
+    With stream=True, returns a generator (see iter_takahashi) instead of a list,
+    so chunking/embedding can start before the file is fully parsed.
+    """
+    records = iter_takahashi(file_path, transcriber)
+    if stream:
+        return records
+    return list(records)
+
+
+def preprocess_all_transcribers(file_path, transcribers=None):
+    """
+    Parse every transcriber (or the given subset) in a single pass over the file.
+    Returns (records_by_transcriber, agreement):
+      - records_by_transcriber: {transcriber: [record, ...]} in file order
+      - agreement: line-by-line comparison between transcribers (see transcriber_agreement)
+    """
+    records_by_transcriber = defaultdict(list)
+    agreement = _AgreementTracker()
+    for rec in iter_takahashi(file_path, transcribers):
+        records_by_transcriber[rec['transcriber']].append(rec)
+        agreement.add(rec)
+    return dict(records_by_transcriber), agreement.report()
+
+
+def transcriber_agreement(records):
+    """
+    Compare transcribers line by line from an iterable of records covering several
+    transcribers (e.g. iter_takahashi(path, transcriber=None)). Variants of the same
+    line are adjacent in the interlinear file, so this needs no second scan.
+    Returns a dict with:
+      - 'lines': {"page.paragraph.row": {'transcribers', 'unanimous', 'token_agreement'}}
+      - 'pairs': {"H/C": {'shared_lines', 'identical_lines', 'line_agreement', 'token_agreement'}}
+    """
+    agreement = _AgreementTracker()
+    for rec in records:
+        agreement.add(rec)
+    return agreement.report()
+
+
+def _token_agreement(a, b):
+    """Share of token positions where two tokenized lines agree."""
+    longest = max(len(a), len(b))
+    if not longest:
+        return 1.0
+    return sum(x == y for x, y in zip(a, b)) / longest
+
+
+class _AgreementTracker:
+    """Accumulates transcriber agreement while records stream past."""
+
+    def __init__(self):
+        self.lines = {}
+        self.pairs = defaultdict(lambda: [0, 0, 0.0])  # shared, identical, token agreement sum
+        self._locator = None
+        self._variants = {}
+
+    def add(self, rec):
+        locator = f"{rec['page']}.{rec['paragraph']}.{rec['row']}"
+        if locator != self._locator:
+            self._flush()
+            self._locator = locator
+        # keep the first reading when a transcriber has alternative readings
+        self._variants.setdefault(rec['transcriber'], rec['tokens'])
+
+    def _flush(self):
+        variants = self._variants
+        if not variants:
+            return
+        names = sorted(variants)
+        scores = []
+        for i, a in enumerate(names):
+            for b in names[i + 1:]:
+                score = _token_agreement(variants[a], variants[b])
+                stats = self.pairs[f"{a}/{b}"]
+                stats[0] += 1
+                stats[1] += variants[a] == variants[b]
+                stats[2] += score
+                scores.append(score)
+        self.lines[self._locator] = {
+            'transcribers': names,
+            'unanimous': all(s == 1.0 for s in scores),
+            'token_agreement': round(sum(scores) / len(scores), 4) if scores else 1.0
+        }
+        self._variants = {}
+
+    def report(self):
+        self._flush()
+        return {
+            'lines': self.lines,
+            'pairs': {
+                pair: {
+                    'shared_lines': shared,
+                    'identical_lines': identical,
+                    'line_agreement': round(identical / shared, 4),
+                    'token_agreement': round(token_sum / shared, 4)
+                }
+                for pair, (shared, identical, token_sum) in sorted(self.pairs.items())
+            }
+        }
 
 def chunk_records(records, chunk_size=5):
     """
     Group records into chunks of N records each, but only within the same 'page'.
     Returns a list of chunk dicts with section metadata.
+    Accepts a list of record dicts or a columnar RecordStore.
     """
+    if isinstance(records, RecordStore):
+        return records.chunk(chunk_size)
     chunks = []
     # 1) Group records by page
     records_by_page = defaultdict(list)
     for rec in records:
         records_by_page[rec['page']].append(rec)
-    
+
     # 2) For each page, slice into chunks
     for page, recs in records_by_page.items():
-        for i in range(0, len(recs), chunk_size):
-            chunk = recs[i : i + chunk_size]
-            combined_text = ' '.join(rec['raw'] for rec in chunk) 
-            
-            # Create metadata with section info
-            metadata = [
-                {
-                    'page': rec['page'],
-                    'paragraph': rec['paragraph'],
-                    'row': rec['row'],
-                    'section': rec['section']  # INCLUDED HERE
-                }
-                for rec in chunk
-            ]
-            
-            chunks.append({
-                'page': page,
-                'metadata': metadata,
-                'text': combined_text
-            })
+        chunks.extend(chunk_page(page, recs, chunk_size))
     return chunks
 
 
+def iter_chunk_records(records, chunk_size=5):
+    """
+    Streaming counterpart of chunk_records: yields the same chunk dicts as soon
+    as each page is complete. Expects records grouped by page, as emitted by
+    iter_takahashi, so only one page is held in memory at a time.
+    """
+    page, recs = None, []
+    for rec in records:
+        if recs and rec['page'] != page:
+            yield from chunk_page(page, recs, chunk_size)
+            recs = []
+        page = rec['page']
+        recs.append(rec)
+    if recs:
+        yield from chunk_page(page, recs, chunk_size)
+
+
 def chunk_lang_records(records, chunk_size=5):
     """
     Group records into chunks of N records each, but only within the same 'page'.
@@ -129,27 +229,8 @@ def chunk_lang_records(records, chunk_size=5):
     records_by_page = defaultdict(list)
     for rec in records:
         records_by_page[rec['page']].append(rec)
-    
+
     # 2) For each page, slice into chunks
     for page, recs in records_by_page.items():
-        for i in range(0, len(recs), chunk_size):
-            chunk = recs[i : i + chunk_size]
-            combined_text = ' '.join(rec['raw'] for rec in chunk) 
-            
-            # Create metadata with section info
-            metadata = [
-                {
-                    'page': rec['page'],
-                    'paragraph': rec['paragraph'],
-                    'row': rec['row'],
-                    'section': rec['section']  # INCLUDED HERE
-                }
-                for rec in chunk
-            ]
-            
-            chunks.append({
-                'page': page,
-                'metadata': metadata,
-                'text': combined_text
-            })
+        chunks.extend(chunk_page(page, recs, chunk_size))
     return chunks
\ No newline at end of file
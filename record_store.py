@@ -0,0 +1,181 @@
+import sys
+import json
+from pathlib import Path
+
+import numpy as np
+
+# Per-record string fields stored as interned integer codes
+CODED_FIELDS = ('page', 'paragraph', 'row', 'transcriber', 'section')
+
+
+def chunk_page(page, recs, chunk_size=5):
+    """
+    Yield the chunks of one page's records, N records each: the chunk schema
+    shared by chunk_records, iter_chunk_records and RecordStore.chunk.
+    """
+    for i in range(0, len(recs), chunk_size):
+        chunk = recs[i : i + chunk_size]
+        yield {
+            'page': page,
+            'metadata': [
+                {
+                    'page': rec['page'],
+                    'paragraph': rec['paragraph'],
+                    'row': rec['row'],
+                    'section': rec['section']
+                }
+                for rec in chunk
+            ],
+            'text': ' '.join(rec['raw'] for rec in chunk)
+        }
+
+
+class RecordStore:
+    """
+    Columnar store for parsed Voynich lines (the records of preprocess_takahashi).
+
+    Instead of one dict per line it keeps:
+      - one int32 code array per metadata field, plus the list of distinct values
+      - one concatenated 'raw' text buffer with int64 offsets
+      - one flat list of interned tokens with int64 offsets
+
+    Iterating the store yields the usual record dicts, so code written for
+    lists of records keeps working; chunk_records and the analysis modules
+    use the columns directly.
+    """
+
+    def __init__(self, values, codes, raw_buffer, raw_offsets, tokens, token_offsets):
+        self.values = values                # field -> list of distinct strings
+        self.codes = codes                  # field -> np.int32 array, one code per record
+        self.raw_buffer = raw_buffer
+        self.raw_offsets = raw_offsets
+        self.tokens = tokens
+        self.token_offsets = token_offsets
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        Build a store from an iterable of record dicts (e.g. iter_takahashi output).
+        Codes are assigned in order of first appearance.
+        """
+        values = {field: [] for field in CODED_FIELDS}
+        lookup = {field: {} for field in CODED_FIELDS}
+        codes = {field: [] for field in CODED_FIELDS}
+        raws, raw_offsets = [], [0]
+        tokens, token_offsets = [], [0]
+
+        for rec in records:
+            for field in CODED_FIELDS:
+                value = rec[field]
+                code = lookup[field].get(value)
+                if code is None:
+                    code = lookup[field][value] = len(values[field])
+                    values[field].append(value)
+                codes[field].append(code)
+            raws.append(rec['raw'])
+            raw_offsets.append(raw_offsets[-1] + len(rec['raw']))
+            tokens.extend(sys.intern(tok) for tok in rec['tokens'])
+            token_offsets.append(len(tokens))
+
+        return cls(
+            values=values,
+            codes={field: np.asarray(c, dtype=np.int32) for field, c in codes.items()},
+            raw_buffer=''.join(raws),
+            raw_offsets=np.asarray(raw_offsets, dtype=np.int64),
+            tokens=tokens,
+            token_offsets=np.asarray(token_offsets, dtype=np.int64)
+        )
+
+    def __len__(self):
+        return len(self.raw_offsets) - 1
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.record(i)
+
+    def __getitem__(self, i):
+        return self.record(i)
+
+    def value(self, field, i):
+        return self.values[field][self.codes[field][i]]
+
+    def raw(self, i):
+        return self.raw_buffer[self.raw_offsets[i]:self.raw_offsets[i + 1]]
+
+    def record_tokens(self, i):
+        return self.tokens[self.token_offsets[i]:self.token_offsets[i + 1]]
+
+    def record(self, i):
+        """Materialize record i in the preprocess_takahashi dict schema."""
+        rec = {field: self.value(field, i) for field in CODED_FIELDS}
+        rec['raw'] = self.raw(i)
+        rec['tokens'] = self.record_tokens(i)
+        return rec
+
+    def column(self, field):
+        """Decoded values of one metadata field, one per record."""
+        return np.asarray(self.values[field], dtype=object)[self.codes[field]]
+
+    def mask(self, field, value):
+        """Boolean mask of the records whose field equals value."""
+        try:
+            code = self.values[field].index(value)
+        except ValueError:
+            return np.zeros(len(self), dtype=bool)
+        return self.codes[field] == code
+
+    def select(self, indices):
+        """New store holding only the given record indices (or boolean mask), in that order."""
+        indices = np.asarray(indices)
+        if indices.dtype == bool:
+            indices = np.flatnonzero(indices)
+        else:
+            indices = indices.astype(np.int64)    # an empty list would otherwise be float64
+        raw_parts, raw_offsets = [], [0]
+        tokens, token_offsets = [], [0]
+        for i in indices:
+            raw_parts.append(self.raw(i))
+            raw_offsets.append(raw_offsets[-1] + len(raw_parts[-1]))
+            tokens.extend(self.record_tokens(i))
+            token_offsets.append(len(tokens))
+        return RecordStore(
+            values=self.values,
+            codes={field: c[indices] for field, c in self.codes.items()},
+            raw_buffer=''.join(raw_parts),
+            raw_offsets=np.asarray(raw_offsets, dtype=np.int64),
+            tokens=tokens,
+            token_offsets=np.asarray(token_offsets, dtype=np.int64)
+        )
+
+    def page_groups(self):
+        """
+        Record indices grouped by page, pages in order of first appearance
+        (the grouping chunk_records uses). Returns a list of (page, indices).
+        """
+        order = np.argsort(self.codes['page'], kind='stable')
+        sorted_codes = self.codes['page'][order]
+        bounds = np.flatnonzero(np.diff(sorted_codes)) + 1
+        return [
+            (self.values['page'][sorted_codes[group[0]]], order[group])
+            for group in np.split(np.arange(len(order)), bounds)
+            if len(group)
+        ]
+
+    def chunk(self, chunk_size=5):
+        """Same output as chunk_records, computed from the columns."""
+        chunks = []
+        for page, idx in self.page_groups():
+            recs = [{'page': page, 'paragraph': self.value('paragraph', i), 'row': self.value('row', i),
+                     'section': self.value('section', i), 'raw': self.raw(i)} for i in idx]
+            chunks.extend(chunk_page(page, recs, chunk_size))
+        return chunks
+
+    def to_jsonl(self, output_path):
+        """Export the records to JSONL in the preprocess_takahashi schema."""
+        out_path = Path(output_path)
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(out_path, 'w', encoding='utf-8') as f:
+            for rec in self:
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        print(f"Saved {len(self)} records to {out_path}")
+        return out_path
@@ -0,0 +1,179 @@
+import os
+import json
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+CACHE_PATH = "data/responses/response_cache.sqlite"
+
+
+def response_key(backend: str, model: str, temperature: float, prompt: str, params: dict = None) -> str:
+    """Hash of everything that determines a completion: backend, model, temperature, extra params, prompt."""
+    head = json.dumps([backend, model, float(temperature), params or {}], sort_keys=True)
+    return hashlib.sha256(f"{head}\x00{prompt}".encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    Persistent prompt -> completion cache in one SQLite file, keyed by response_key().
+
+    Only calls at temperature <= `max_temperature` (greedy by default) are cached,
+    since sampled completions are not meant to repeat. Entries are evicted least
+    recently used once the stored text exceeds `max_bytes`. enabled=False (or
+    RESPONSE_CACHE=0 for default_cache) turns it into a pass-through that still
+    counts bypassed calls. Safe to share between threads.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_bytes: int = 256 * 2**20,
+                 max_temperature: float = 0.0, enabled: bool = True):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.max_temperature = max_temperature
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.stores = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._db = None
+        self._bytes = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("""CREATE TABLE IF NOT EXISTS responses (
+                              key TEXT PRIMARY KEY, backend TEXT, model TEXT, temperature REAL,
+                              response TEXT NOT NULL, size INTEGER NOT NULL, created REAL, last_used REAL)""")
+            db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+            self._bytes = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            self._db = db
+        return self._db
+
+    def cacheable(self, temperature: float) -> bool:
+        return self.enabled and temperature <= self.max_temperature
+
+    def __len__(self):
+        with self._lock:
+            return self._conn().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def get(self, backend: str, model: str, temperature: float, prompt: str, params: dict = None):
+        """Cached completion text, or None (a miss, or a bypass when the call is not cacheable)."""
+        if not self.cacheable(temperature):
+            self.bypassed += 1
+            return None
+        key = response_key(backend, model, temperature, prompt, params)
+        with self._lock:
+            db = self._conn()
+            row = db.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, backend: str, model: str, temperature: float, prompt: str, response: str,
+            params: dict = None) -> bool:
+        """Store a completion; False when the call is not cacheable or the text alone exceeds max_bytes."""
+        if not self.cacheable(temperature) or response is None:
+            return False
+        size = len(response.encode('utf-8'))
+        if size > self.max_bytes:
+            return False
+        key = response_key(backend, model, temperature, prompt, params)
+        now = time.time()
+        with self._lock:
+            db = self._conn()
+            old = db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                       (key, backend, model, float(temperature), response, size, now, now))
+            self._bytes += size - (old[0] if old else 0)
+            self.stores += 1
+            if self._bytes > self.max_bytes:
+                self._evict(db)
+        return True
+
+    def _evict(self, db):
+        """Drop least recently used entries until the cache is back under max_bytes."""
+        excess, victims = self._bytes - self.max_bytes, []
+        for key, size in db.execute("SELECT key, size FROM responses ORDER BY last_used"):
+            if excess <= 0:
+                break
+            victims.append((key,))
+            excess -= size
+            self._bytes -= size
+        db.executemany("DELETE FROM responses WHERE key = ?", victims)
+        self.evictions += len(victims)
+
+    def latest_model(self, backend: str):
+        """Model of the most recently used entry of a backend (None if there is none)."""
+        with self._lock:
+            row = self._conn().execute("SELECT model FROM responses WHERE backend = ? "
+                                       "ORDER BY last_used DESC LIMIT 1", (backend,)).fetchone()
+        return row[0] if row else None
+
+    def warm_from_responses(self, responses_path: str, backend: str = "openai",
+                            model: str = "gpt-4.1", temperature: float = 0.0) -> int:
+        """
+        Seed the cache from a responses.jsonl session ({"prompt", "response", ...} lines),
+        so replaying it is served locally. Records that carry their own model and
+        temperature use those. Returns the number of entries stored.
+        """
+        stored = 0
+        with open(responses_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                response = entry.get("response")
+                if "prompt" not in entry or response is None:
+                    continue
+                # call_openai caches the raw completion; parsed JSON round-trips to an equivalent one
+                if isinstance(response, dict) and set(response) == {"raw_response"}:
+                    response = response["raw_response"]
+                elif not isinstance(response, str):
+                    response = json.dumps(response, ensure_ascii=False)
+                stored += self.put(entry.get("backend", backend), entry.get("model", model),
+                                   entry.get("temperature", temperature), entry["prompt"], response)
+        return stored
+
+    def clear(self):
+        with self._lock:
+            self._conn().execute("DELETE FROM responses")
+            self._bytes = 0
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {"entries": len(self), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses, "bypassed": self.bypassed,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "stores": self.stores, "evictions": self.evictions, "path": str(self.path)}
+
+
+_DEFAULT_CACHES = {}
+_DEFAULT_LOCK = threading.Lock()
+
+
+def default_cache(path: str = CACHE_PATH) -> ResponseCache:
+    """Process-wide cache for a path (RESPONSE_CACHE=0 disables it, RESPONSE_CACHE_MB sizes it)."""
+    with _DEFAULT_LOCK:
+        cache = _DEFAULT_CACHES.get(path)
+        if cache is None:
+            cache = _DEFAULT_CACHES[path] = ResponseCache(
+                path,
+                max_bytes=int(os.getenv("RESPONSE_CACHE_MB", "256")) * 2**20,
+                enabled=os.getenv("RESPONSE_CACHE", "1") != "0"
+            )
+        return cache
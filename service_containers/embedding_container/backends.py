@@ -0,0 +1,146 @@
+"""
+Selectable inference backends for the embedding service.
+
+  torch  full fp32 SentenceTransformer (reference)
+  int8   SentenceTransformer with dynamic int8 quantization of every nn.Linear (CPU only)
+  onnx   ONNX Runtime graph exported from the same checkpoint, with the model's
+         mean pooling and normalization reproduced in NumPy
+         (needs `pip install -r requirements_onnx.txt`)
+
+Every backend exposes `encode(texts, batch_size=32, convert_to_tensor=False)` returning
+an (n, dim) float32 array, and a `tokenizer`. The tokens each encoded text used
+(attention-mask sums, after truncation) collect in `token_counts`; see
+metrics.pop_token_counts.
+
+Cosine tolerance against the fp32 torch backend, enforced by check_backend.py on a
+fixed sample of voynich_chunks_H.json texts: the minimum per-text cosine similarity
+must reach COSINE_TOLERANCE[backend].
+"""
+import os
+from pathlib import Path
+
+import numpy as np
+import torch
+from sentence_transformers import SentenceTransformer
+
+BACKENDS = ("torch", "int8", "onnx")
+
+COSINE_TOLERANCE = {
+    "torch": 0.99999,
+    "onnx": 0.9999,   # same fp32 weights, different kernels
+    "int8": 0.98      # dynamic int8 Linear layers
+}
+
+
+# torch's own default (physical cores), before configure_threads changes it
+_TORCH_THREADS = torch.get_num_threads()
+
+
+def _cgroup_cpu_limit():
+    """CPU quota of the container (cgroup v2 cpu.max or v1 cfs quota), rounded up; None if unlimited."""
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()[:2]
+    except (OSError, ValueError):
+        try:
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f, open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as g:
+                quota, period = f.read().strip(), g.read().strip()
+        except OSError:
+            return None
+    if quota in ("max", "-1"):
+        return None
+    return max(1, -(-int(quota) // int(period)))
+
+
+def default_threads() -> int:
+    """torch's default thread count, capped by the CPUs this process may run on and the container quota."""
+    limits = [_TORCH_THREADS]
+    if hasattr(os, "sched_getaffinity"):
+        limits.append(len(os.sched_getaffinity(0)))
+    quota = _cgroup_cpu_limit()
+    if quota:
+        limits.append(quota)
+    return max(1, min(limits))
+
+
+def configure_threads(threads: int = None) -> int:
+    """Set intra-op threads (default: EMBED_THREADS or default_threads()); returns the value used."""
+    threads = threads or int(os.getenv("EMBED_THREADS", "0")) or default_threads()
+    torch.set_num_threads(threads)
+    return threads
+
+
+def _track_token_counts(model):
+    """Record the attention-mask sums of every batch SentenceTransformer.encode tokenizes."""
+    tokenize = model.tokenize
+
+    def counting_tokenize(texts, *args, **kwargs):
+        features = tokenize(texts, *args, **kwargs)
+        if "attention_mask" in features:
+            model.token_counts.extend(features["attention_mask"].sum(dim=1).tolist())
+        return features
+
+    model.token_counts = []
+    model.tokenize = counting_tokenize
+    return model
+
+
+class OnnxEncoder:
+    """Sentence encoder running an exported ONNX graph under ONNX Runtime."""
+
+    def __init__(self, model_path: str, threads: int, export_dir: str = None):
+        import onnxruntime
+        from optimum.onnxruntime import ORTModelForFeatureExtraction
+        from transformers import AutoTokenizer
+
+        st_model = SentenceTransformer(model_path, device="cpu")
+        transformer_path = Path(model_path)
+        self.normalize = any(type(m).__name__ == "Normalize" for m in st_model)
+        self.max_seq_length = st_model.max_seq_length
+        del st_model
+
+        export_dir = Path(export_dir or os.getenv("EMBED_ONNX_DIR", str(transformer_path) + "-onnx"))
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        if (export_dir / "model.onnx").exists():
+            self.model = ORTModelForFeatureExtraction.from_pretrained(export_dir, session_options=options)
+        else:
+            # export once, then reuse the serialized graph on later starts
+            self.model = ORTModelForFeatureExtraction.from_pretrained(
+                transformer_path, export=True, session_options=options)
+            self.model.save_pretrained(export_dir)
+        self.tokenizer = AutoTokenizer.from_pretrained(transformer_path)
+        self.token_counts = []
+
+    def encode(self, texts, batch_size: int = 32, convert_to_tensor: bool = False, **kwargs):
+        out = []
+        for start in range(0, len(texts), batch_size):
+            batch = self.tokenizer(list(texts[start:start + batch_size]), padding=True, truncation=True,
+                                   max_length=self.max_seq_length, return_tensors="np")
+            hidden = self.model(**batch).last_hidden_state
+            hidden = hidden.numpy() if hasattr(hidden, "numpy") else np.asarray(hidden)
+            mask = batch["attention_mask"][..., None].astype(np.float32)
+            self.token_counts.extend(batch["attention_mask"].sum(axis=1).tolist())
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            if self.normalize:
+                pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            out.append(pooled.astype(np.float32))
+        return np.concatenate(out) if out else np.zeros((0, 0), dtype=np.float32)
+
+
+def load_backend(name: str = None, model_path: str = "/app/models/mpnet", device: str = "cpu",
+                 threads: int = None):
+    """Load the embedding model for a backend name (default: EMBED_BACKEND or 'torch')."""
+    name = name or os.getenv("EMBED_BACKEND", "torch")
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend {name!r}; expected one of {BACKENDS}")
+    threads = configure_threads(threads)
+
+    if name == "onnx":
+        return OnnxEncoder(model_path, threads)
+
+    model = SentenceTransformer(model_path, device=device if name == "torch" else "cpu")
+    if name == "int8":
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return _track_token_counts(model)
@@ -0,0 +1,102 @@
+import threading
+import queue
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class MicroBatcher:
+    """
+    Coalesces texts from concurrent /embed requests into shared model calls.
+
+    A worker thread waits for the first pending request, then keeps collecting
+    requests for up to `max_wait_ms` or until `max_batch_texts` texts are queued.
+    The gathered texts are sorted by length (so padding inside each encode batch
+    stays small), encoded with one call and the vectors are routed back to each
+    caller in its original order. Works the same on CPU and GPU.
+    """
+
+    def __init__(self, encode_fn, max_wait_ms: float = 10.0, max_batch_texts: int = 128):
+        self.encode_fn = encode_fn
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_batch_texts = max_batch_texts
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._queued_texts = 0
+        # batch-size histogram buckets: 1, 2, 4, ... up to max_batch_texts and beyond
+        self.buckets = [2 ** i for i in range(max(max_batch_texts, 1).bit_length() + 1)]
+        self.batch_histogram = [0] * (len(self.buckets) + 1)
+        self.batches = 0
+        self.texts = 0
+        self.requests = 0
+        self._worker = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, texts) -> np.ndarray:
+        """Queue texts and block until their vectors are ready; returns an (n, dim) array."""
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        future = Future()
+        with self._lock:
+            self._queued_texts += len(texts)
+        self._queue.put((list(texts), future))
+        return future.result()
+
+    def _collect(self):
+        first = self._queue.get()
+        items, count = [first], len(first[0])
+        deadline = time.perf_counter() + self.max_wait
+        while count < self.max_batch_texts:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            items.append(item)
+            count += len(item[0])
+        with self._lock:
+            self._queued_texts -= count
+        return items
+
+    def _run(self):
+        while True:
+            items = self._collect()
+            texts = [t for batch, _ in items for t in batch]
+            try:
+                order = np.argsort([len(t) for t in texts], kind="stable")
+                encoded = np.asarray(self.encode_fn([texts[i] for i in order]), dtype=np.float32)
+                vectors = np.empty_like(encoded)
+                vectors[order] = encoded
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+            self._record(len(texts), len(items))
+            start = 0
+            for batch, future in items:
+                future.set_result(vectors[start:start + len(batch)])
+                start += len(batch)
+
+    def _record(self, batch_size, requests):
+        bucket = next((i for i, b in enumerate(self.buckets) if batch_size <= b), len(self.buckets))
+        with self._lock:
+            self.batch_histogram[bucket] += 1
+            self.batches += 1
+            self.texts += batch_size
+            self.requests += requests
+
+    def stats(self) -> dict:
+        with self._lock:
+            labels = [f"<={b}" for b in self.buckets] + [f">{self.buckets[-1]}"]
+            return {
+                "queue_depth_requests": self._queue.qsize(),
+                "queue_depth_texts": self._queued_texts,
+                "batches": self.batches,
+                "texts": self.texts,
+                "requests": self.requests,
+                "mean_batch_size": self.texts / self.batches if self.batches else 0.0,
+                "batch_size_histogram": dict(zip(labels, self.batch_histogram))
+            }
@@ -0,0 +1,78 @@
+"""
+Parity and throughput check of an embedding backend against the fp32 torch model.
+
+Encodes a fixed sample of voynich_chunks_H.json texts with both, reports per-text
+cosine similarity (min / mean) and texts per second at each of a few thread counts
+(default: 1, half and all of backends.default_threads()), and exits non-zero when
+the minimum cosine falls below the backend's COSINE_TOLERANCE.
+
+    python check_backend.py --backend int8 --chunks /data/processed/voynich_chunks_H.json --threads 1 2 4
+"""
+import argparse
+import json
+import random
+import sys
+import time
+
+import numpy as np
+
+from backends import BACKENDS, COSINE_TOLERANCE, default_threads, load_backend
+
+
+def sample_texts(chunks_path: str, n: int = 128, seed: int = 0) -> list:
+    with open(chunks_path, "r", encoding="utf-8") as f:
+        texts = [chunk["text"] for chunk in json.load(f)]
+    return random.Random(seed).sample(texts, min(n, len(texts)))
+
+
+def throughput(model, texts, batch_size: int, repeats: int = 3):
+    """Encode the texts `repeats` times (after one warm-up pass); returns (vectors, texts/sec)."""
+    vectors = np.asarray(model.encode(texts, batch_size=batch_size, convert_to_tensor=False), dtype=np.float32)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        model.encode(texts, batch_size=batch_size, convert_to_tensor=False)
+    return vectors, repeats * len(texts) / (time.perf_counter() - start)
+
+
+def cosine_rows(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return (a * b).sum(axis=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=BACKENDS, required=True)
+    parser.add_argument("--chunks", default="data/processed/voynich_chunks_H.json")
+    parser.add_argument("--model", default="/app/models/mpnet")
+    parser.add_argument("--samples", type=int, default=128)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threads", type=int, nargs="+", default=None, help="thread counts to measure")
+    args = parser.parse_args()
+
+    cores = default_threads()
+    thread_counts = sorted(set(args.threads or [1, max(1, cores // 2), cores]))
+    texts = sample_texts(args.chunks, args.samples)
+    print(f"Texts: {len(texts)} from {args.chunks}")
+    for threads in thread_counts:
+        # reload per count: ONNX Runtime fixes its thread pool when the session is created
+        reference = load_backend("torch", args.model, device="cpu", threads=threads)
+        ref_vectors, ref_rate = throughput(reference, texts, args.batch_size)
+        del reference
+        candidate = load_backend(args.backend, args.model, device="cpu", threads=threads)
+        vectors, rate = throughput(candidate, texts, args.batch_size)
+        del candidate
+        print(f"{threads:>3} threads | fp32 torch: {ref_rate:.1f} texts/sec | "
+              f"{args.backend}: {rate:.1f} texts/sec ({rate / ref_rate:.2f}x)")
+
+    cos = cosine_rows(ref_vectors, vectors)
+    tolerance = COSINE_TOLERANCE[args.backend]
+    print(f"Cosine vs fp32: min {cos.min():.6f}, mean {cos.mean():.6f} (tolerance {tolerance})")
+    if cos.min() < tolerance:
+        print("❌ Parity check failed")
+        sys.exit(1)
+    print("✅ Parity check passed")
+
+
+if __name__ == "__main__":
+    main()
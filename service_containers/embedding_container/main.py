@@ -1,75 +1,161 @@
-from fastapi import FastAPI, HTTPException
+import time
+STARTED = time.perf_counter()
+
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-from sentence_transformers import SentenceTransformer
-import torch
-import time  # Add this import
-
-print(f"\n=== GPU STATUS ===")
-print(f"• CUDA available: {torch.cuda.is_available()}")
-print(f"• GPU count: {torch.cuda.device_count()}")
-if torch.cuda.is_available():
-    print(f"• Current device: {torch.cuda.current_device()} → {torch.cuda.get_device_name(0)}")
-    print(f"• CUDA version: {torch.version.cuda}")
-    print(f"• PyTorch CUDA supported: {torch.cuda.is_available()}")
-    print(f"• GPU memory: {torch.cuda.get_device_properties(0).total_memory/1e9:.2f} GB")
-print("=================\n")
-
-app = FastAPI()
-
-# Check GPU availability
-device = "cuda" if torch.cuda.is_available() else "cpu"
-model = SentenceTransformer('/app/models/mpnet', device=device)
-print(f"Model loaded on device: {device}")
+import numpy as np
+import io
+import struct
+import os
+import threading
+
+from batching import MicroBatcher
+from metrics import EmbedMetrics, pop_token_counts
+
+# EMBED_DEBUG=1 prints per-request diagnostics; otherwise observe the service through /metrics
+DEBUG = os.getenv("EMBED_DEBUG", "0") == "1"
+# EMBED_BACKEND=torch|int8|onnx picks the inference backend (int8/onnx run on CPU),
+# EMBED_THREADS the intra-op thread count (see backends.py)
+BACKEND = os.getenv("EMBED_BACKEND", "torch")
+MODEL_PATH = os.getenv("EMBED_MODEL_PATH", "/app/models/mpnet")
+ENCODE_BATCH_SIZE = int(os.getenv("EMBED_ENCODE_BATCH_SIZE", "32"))
+WARMUP_TEXTS = ["otedy qokeedy qokedy", "daiin shol chol chor"] * 4
+
+metrics = EmbedMetrics()
+model = None
+# loading -> ready | error; timings are seconds since the process imported this module
+startup = {"status": "loading", "error": None, "device": None, "backend": BACKEND,
+           "model_load_seconds": None, "ready_seconds": None, "first_request_seconds": None}
+
+def load_model():
+    """Import torch, load the model from the local snapshot and run a warm-up batch (background thread)."""
+    global model
+    try:
+        import torch
+        from backends import load_backend
+
+        print(f"\n=== GPU STATUS ===")
+        print(f"• CUDA available: {torch.cuda.is_available()}")
+        print(f"• GPU count: {torch.cuda.device_count()}")
+        if torch.cuda.is_available():
+            print(f"• Current device: {torch.cuda.current_device()} → {torch.cuda.get_device_name(0)}")
+            print(f"• CUDA version: {torch.version.cuda}")
+            print(f"• PyTorch CUDA supported: {torch.cuda.is_available()}")
+            print(f"• GPU memory: {torch.cuda.get_device_properties(0).total_memory/1e9:.2f} GB")
+        print("=================\n")
+
+        # Check GPU availability
+        device = "cuda" if torch.cuda.is_available() and BACKEND == "torch" else "cpu"
+        load_start = time.perf_counter()
+        loaded = load_backend(BACKEND, MODEL_PATH, device=device)
+        metrics.model_load.set(time.perf_counter() - load_start)
+        loaded.encode(WARMUP_TEXTS, convert_to_tensor=False, batch_size=ENCODE_BATCH_SIZE)
+        pop_token_counts(loaded)  # keep the warm-up out of the token metrics
+        model = loaded
+        startup.update(status="ready", device=device,
+                       model_load_seconds=round(time.perf_counter() - load_start, 3),
+                       ready_seconds=round(time.perf_counter() - STARTED, 3))
+        print(f"Model loaded on device: {device} (backend: {BACKEND}, threads: {torch.get_num_threads()}), "
+              f"ready {startup['ready_seconds']}s after start")
+    except Exception as e:
+        startup.update(status="error", error=str(e))
+        print(f"❌ Model load failed: {e}")
+
+@asynccontextmanager
+async def lifespan(app):
+    threading.Thread(target=load_model, name="embed-model-load", daemon=True).start()
+    yield
+
+app = FastAPI(lifespan=lifespan)
+
+def encode_batch(texts):
+    start = time.perf_counter()
+    vectors = model.encode(texts, convert_to_tensor=False, batch_size=ENCODE_BATCH_SIZE)
+    metrics.observe_batch(texts, time.perf_counter() - start, pop_token_counts(model))
+    return vectors
+
+# Requests are coalesced into shared encode calls (see batching.MicroBatcher)
+batcher = MicroBatcher(
+    encode_batch,
+    max_wait_ms=float(os.getenv("EMBED_MAX_WAIT_MS", "10")),
+    max_batch_texts=int(os.getenv("EMBED_MAX_BATCH_TEXTS", "128"))
+)
 
 class EmbedRequest(BaseModel):
     texts: list[str]
 
+# Binary response formats, selected with the Accept header (JSON stays the default)
+NPY_MEDIA_TYPE = "application/x-npy"
+RAW_MEDIA_TYPE = "application/octet-stream"
+
+def encode_vectors(embeddings, accept: str):
+    """
+    Serialize the embedding matrix for the requested media type:
+      - application/x-npy: .npy bytes of a float32 (n, dim) array
+      - application/octet-stream: <uint32 n><uint32 dim> header, then little-endian float32 rows
+      - anything else: {"vectors": [[...], ...]}
+    """
+    matrix = np.ascontiguousarray(embeddings, dtype="<f4")
+    if NPY_MEDIA_TYPE in accept:
+        buf = io.BytesIO()
+        np.save(buf, matrix, allow_pickle=False)
+        return Response(content=buf.getvalue(), media_type=NPY_MEDIA_TYPE)
+    if RAW_MEDIA_TYPE in accept:
+        rows, dim = matrix.shape if matrix.ndim == 2 else (0, 0)
+        return Response(content=struct.pack("<II", rows, dim) + matrix.tobytes(), media_type=RAW_MEDIA_TYPE)
+    return {"vectors": matrix.tolist()}
+
 @app.post("/embed")
-def embed(req: EmbedRequest):
+def embed(req: EmbedRequest, request: Request):
+    if model is None:
+        raise HTTPException(status_code=503, detail=f"Model {startup['status']}", headers={"Retry-After": "5"})
+    start_time = time.perf_counter()
     try:
-        # ===== GPU DIAGNOSTICS START =====
-        print("\n=== EMBEDDING START ===")
-        print(f"Processing {len(req.texts)} texts")
-        
-        # Pre-execution diagnostics
-        if torch.cuda.is_available():
-            initial_mem_alloc = torch.cuda.memory_allocated()
-            initial_mem_reserved = torch.cuda.memory_reserved()
-            initial_utilization = torch.cuda.utilization()
-            print(f"Pre-execution GPU memory: {initial_mem_alloc/1e6:.2f} MB allocated, {initial_mem_reserved/1e6:.2f} MB reserved")
-            print(f"GPU utilization: {initial_utilization}%")
-        
-        start_time = time.perf_counter()
-        # ===== MAIN EMBEDDING OPERATION =====
-        embeddings = model.encode(req.texts, convert_to_tensor=False)
+        if DEBUG:
+            import torch
+
+            print("\n=== EMBEDDING START ===")
+            print(f"Processing {len(req.texts)} texts")
+            if torch.cuda.is_available():
+                initial_mem_alloc = torch.cuda.memory_allocated()
+                print(f"Pre-execution GPU memory: {initial_mem_alloc/1e6:.2f} MB allocated, "
+                      f"{torch.cuda.memory_reserved()/1e6:.2f} MB reserved")
+
+        embeddings = batcher.submit(req.texts)
         processing_time = time.perf_counter() - start_time
-        # ===== END EMBEDDING OPERATION =====
-        
-        # Post-execution diagnostics
-        print(f"Embedding completed in {processing_time:.4f} seconds")
-        print(f"Avg time per text: {processing_time/len(req.texts):.4f} sec")
-        
-        if torch.cuda.is_available():
-            final_mem_alloc = torch.cuda.memory_allocated()
-            final_mem_reserved = torch.cuda.memory_reserved()
-            final_utilization = torch.cuda.utilization()
-            
-            print(f"Post-execution GPU memory: {final_mem_alloc/1e6:.2f} MB allocated, {final_mem_reserved/1e6:.2f} MB reserved")
-            print(f"Memory delta: {(final_mem_alloc - initial_mem_alloc)/1e6:.2f} MB allocated, {(final_mem_reserved - initial_mem_reserved)/1e6:.2f} MB reserved")
-            print(f"GPU utilization: {final_utilization}%")
-            
-            # Verify tensor operations device
-            try:
-                test_tensor = torch.tensor([1.0, 2.0, 3.0], device=device)
-                print(f"Test tensor created on: {test_tensor.device}")
-                if test_tensor.device.type == 'cuda':
-                    print("✅ GPU tensor operations confirmed")
-            except Exception as e:
-                print(f"❌ Tensor test failed: {str(e)}")
-        
-        print("========================\n")
-        # ===== GPU DIAGNOSTICS END =====
-        
-        return {"vectors": [vec.tolist() for vec in embeddings]}
+
+        if DEBUG:
+            print(f"Embedding completed in {processing_time:.4f} seconds")
+            print(f"Avg time per text: {processing_time/max(len(req.texts), 1):.4f} sec")
+            if torch.cuda.is_available():
+                final_mem_alloc = torch.cuda.memory_allocated()
+                print(f"Post-execution GPU memory: {final_mem_alloc/1e6:.2f} MB allocated, "
+                      f"{torch.cuda.memory_reserved()/1e6:.2f} MB reserved")
+                print(f"Memory delta: {(final_mem_alloc - initial_mem_alloc)/1e6:.2f} MB allocated")
+            print("========================\n")
+
+        response = encode_vectors(embeddings, request.headers.get("accept", ""))
+        metrics.requests.inc()
+        metrics.latency.observe(time.perf_counter() - start_time)
+        if startup["first_request_seconds"] is None:
+            startup["first_request_seconds"] = round(time.perf_counter() - STARTED, 3)
+            print(f"First request served {startup['first_request_seconds']}s after start")
+        return response
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        metrics.errors.inc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/health")
+def health():
+    """200 once the model is loaded and warmed up, 503 while loading or after a failed load."""
+    return JSONResponse(status_code=200 if startup["status"] == "ready" else 503, content=startup)
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return Response(content=metrics.render(), media_type=EmbedMetrics.CONTENT_TYPE)
+
+@app.get("/batching")
+def batching_stats():
+    return batcher.stats()
@@ -0,0 +1,169 @@
+"""
+Minimal Prometheus text-format metrics (counters, gauges, histograms) for the
+embedding service, without depending on prometheus_client.
+"""
+import bisect
+import os
+import resource
+import threading
+import time
+from collections import deque
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+TOKEN_BUCKETS = (8, 16, 32, 64, 128, 256, 384, 512)
+
+
+def _fmt(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric:
+    def __init__(self, name: str, help_text: str, kind: str):
+        self.name = name
+        self.help = help_text
+        self.kind = kind
+        self._lock = threading.Lock()
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    def __init__(self, name, help_text):
+        super().__init__(name, help_text, "counter")
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def render(self):
+        return self.header() + [f"{self.name} {_fmt(self.value)}"]
+
+
+class Gauge(Metric):
+    """Gauge with a fixed value, or computed on each scrape when `fn` is given."""
+
+    def __init__(self, name, help_text, fn=None):
+        super().__init__(name, help_text, "gauge")
+        self.value = 0.0
+        self.fn = fn
+
+    def set(self, value: float):
+        self.value = value
+
+    def render(self):
+        value = self.fn() if self.fn else self.value
+        return self.header() + [f"{self.name} {_fmt(value)}"]
+
+
+class Histogram(Metric):
+    def __init__(self, name, help_text, buckets):
+        super().__init__(name, help_text, "histogram")
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float, times: int = 1):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += times
+            self.sum += value * times
+            self.count += times
+
+    def render(self):
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        lines, cumulative = self.header(), 0
+        for bound, n in zip(self.buckets, counts):
+            cumulative += n
+            lines.append(f'{self.name}_bucket{{le="{bound:g}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {count}')
+        lines.append(f"{self.name}_sum {_fmt(total)}")
+        lines.append(f"{self.name}_count {count}")
+        return lines
+
+
+class Throughput:
+    """Events per second over a sliding window."""
+
+    def __init__(self, window: float = 60.0):
+        self.window = window
+        self._events = deque()
+        self._lock = threading.Lock()
+
+    def add(self, amount: int):
+        with self._lock:
+            self._events.append((time.monotonic(), amount))
+
+    def rate(self) -> float:
+        now = time.monotonic()
+        with self._lock:
+            while self._events and self._events[0][0] < now - self.window:
+                self._events.popleft()
+            return sum(n for _, n in self._events) / self.window
+
+
+def process_rss_bytes() -> int:
+    """Resident set size of this process (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for m in self.metrics for line in m.render()) + "\n"
+
+
+def pop_token_counts(model) -> list:
+    """Tokens per text a backend encoded since the last call (in encode's internal order)."""
+    counts = getattr(model, "token_counts", None) or []
+    model.token_counts = []
+    return counts
+
+
+class EmbedMetrics:
+    """All metrics exported by the embedding service on /metrics."""
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self.registry = Registry()
+        self.throughput = Throughput()
+        reg = self.registry.register
+        self.requests = reg(Counter("embed_requests_total", "Completed /embed requests"))
+        self.errors = reg(Counter("embed_request_errors_total", "Failed /embed requests"))
+        self.texts = reg(Counter("embed_texts_total", "Texts embedded"))
+        self.latency = reg(Histogram("embed_request_latency_seconds", "/embed request latency", LATENCY_BUCKETS))
+        self.encode_latency = reg(Histogram("embed_encode_seconds", "Model encode time per coalesced batch",
+                                            LATENCY_BUCKETS))
+        self.batch_size = reg(Histogram("embed_batch_size_texts", "Texts per coalesced encode batch", BATCH_BUCKETS))
+        self.tokens = reg(Histogram("embed_tokens_per_text", "Tokens per embedded text (after truncation)",
+                                    TOKEN_BUCKETS))
+        reg(Gauge("embed_texts_per_second", "Texts embedded per second over the last minute", self.throughput.rate))
+        self.model_load = reg(Gauge("embed_model_load_seconds", "Time taken to load the model"))
+        reg(Gauge("process_resident_memory_bytes", "Resident memory of the service process", process_rss_bytes))
+
+    def observe_batch(self, texts, seconds: float, token_counts=()):
+        """token_counts: tokens per text from the encoding itself (pop_token_counts)."""
+        self.batch_size.observe(len(texts))
+        self.encode_latency.observe(seconds)
+        self.texts.inc(len(texts))
+        self.throughput.add(len(texts))
+        for count in token_counts:
+            self.tokens.observe(count)
+
+    def render(self) -> str:
+        return self.registry.render()
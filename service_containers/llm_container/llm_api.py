@@ -1,64 +1,80 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from transformers import AutoModelForCausalLM, AutoTokenizer, pipeline
-import torch
 import time
+STARTED = time.perf_counter()
+
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+import asyncio
+import json
+import os
+import queue
+import threading
 import logging
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("LLM_API")
 
-app = FastAPI()
-
-# --- Device Configuration ---
-device = "cuda" if torch.cuda.is_available() else "cpu"
-logger.info(f"Using device: {device}")
-logger.info(f"PyTorch version: {torch.__version__}")
-logger.info(f"CUDA available: {torch.cuda.is_available()}")
-if torch.cuda.is_available():
-    logger.info(f"CUDA version: {torch.version.cuda}")
+# GPU model, and the small instruction model used when CUDA is unavailable (or the GPU load fails).
+# Either can be a local snapshot directory instead of a Hub id.
+GPU_MODEL = os.getenv("LLM_MODEL", "TheBloke/Mistral-7B-Instruct-v0.1-GPTQ")
+CPU_MODEL = os.getenv("LLM_CPU_MODEL", "Qwen/Qwen2.5-0.5B-Instruct")
 
 # --- Load LLM Model ---
+torch = None
 llm_model = None
 llm_tokenizer = None
-llm_pipeline = None
+llm_scheduler = None
+# loading -> ready | error; timings are seconds since the process imported this module
+startup = {"status": "loading", "error": None, "model": None, "device": None,
+           "model_load_seconds": None, "ready_seconds": None, "first_request_seconds": None}
 
-def load_llm():
-    global llm_model, llm_tokenizer, llm_pipeline
+def load_llm(model_name: str, device: str):
+    global llm_model, llm_tokenizer, llm_scheduler
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+    from scheduler import GenerationScheduler
+    from prefix_cache import PrefixCache
     try:
-        logger.info("Loading LLM model...")
-        llm_model_name = "TheBloke/Mistral-7B-Instruct-v0.1-GPTQ"
-        
-        # Clear cache before loading
-        if torch.cuda.is_available():
+        logger.info(f"Loading LLM model {model_name} on {device}...")
+
+        if device == "cuda":
+            # Clear cache before loading
             torch.cuda.empty_cache()
-        
-        # Load model with basic configuration
-        llm_model = AutoModelForCausalLM.from_pretrained(
-            llm_model_name,
-            device_map="auto",
-            trust_remote_code=False
-        )
-        
+            # Load model with basic configuration
+            llm_model = AutoModelForCausalLM.from_pretrained(
+                model_name,
+                device_map="auto",
+                trust_remote_code=False
+            )
+        else:
+            llm_model = AutoModelForCausalLM.from_pretrained(
+                model_name,
+                torch_dtype=torch.float32,
+                trust_remote_code=False
+            )
+
         llm_tokenizer = AutoTokenizer.from_pretrained(
-            llm_model_name, 
+            model_name,
             use_fast=True
         )
-        
-        # Create text generation pipeline
-        llm_pipeline = pipeline(
-        "text-generation",
-        model=llm_model,
-        tokenizer=llm_tokenizer,
-        max_new_tokens=512,
-        temperature=0.7,
-        top_p=0.95,
-        repetition_penalty=1.15,
-        do_sample=True,  
-        pad_token_id=llm_tokenizer.eos_token_id  
+
+        # KV of shared prompt prefixes (instruction/context headers); LLM_PREFIX_CACHE_MB=0 disables it
+        prefix_cache_mb = int(os.getenv("LLM_PREFIX_CACHE_MB", "1024"))
+        prefix_cache = PrefixCache(
+            max_bytes=prefix_cache_mb * 2**20,
+            block_size=int(os.getenv("LLM_PREFIX_BLOCK", "64"))
+        ) if prefix_cache_mb > 0 else None
+
+        # Continuous-batching scheduler (see scheduler.py); sampling defaults match the old pipeline
+        llm_scheduler = GenerationScheduler(
+            llm_model,
+            llm_tokenizer,
+            max_batch=int(os.getenv("LLM_MAX_BATCH", "8")),
+            max_wait_ms=float(os.getenv("LLM_MAX_WAIT_MS", "20")),
+            prefix_cache=prefix_cache
         )
-        logger.info("LLM pipeline ready")
+        logger.info("LLM scheduler ready")
         return True
     except Exception as e:
         logger.error(f"LLM load failed: {str(e)}")
@@ -66,55 +82,194 @@ def load_llm():
         logger.error(traceback.format_exc())
         return False
 
-# Load the model at startup
-if torch.cuda.is_available():
-    if not load_llm():
-        logger.error("Failed to load LLM. Exiting...")
-        exit(1)
-else:
-    logger.error("No GPU available. LLM requires CUDA.")
-    exit(1)
+def start_llm():
+    """Import torch, load the GPU model (or the CPU fallback) and run a warm-up generation."""
+    global torch
+    try:
+        import torch as _torch
+        torch = _torch
+
+        # --- Device Configuration ---
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        logger.info(f"Using device: {device}")
+        logger.info(f"PyTorch version: {torch.__version__}")
+        logger.info(f"CUDA available: {torch.cuda.is_available()}")
+        if torch.cuda.is_available():
+            logger.info(f"CUDA version: {torch.version.cuda}")
+
+        load_start = time.perf_counter()
+        model_name = GPU_MODEL
+        if device != "cuda" or not load_llm(GPU_MODEL, device):
+            if device == "cuda":
+                logger.warning(f"Failed to load {GPU_MODEL}; falling back to {CPU_MODEL} on CPU")
+            else:
+                logger.warning(f"No GPU available; using CPU model {CPU_MODEL}")
+            model_name, device = CPU_MODEL, "cpu"
+            if not load_llm(CPU_MODEL, device):
+                raise RuntimeError(f"Failed to load {CPU_MODEL}")
+        model_load_seconds = time.perf_counter() - load_start
+
+        startup.update(model=model_name, device=device)
+        llm_scheduler.generate(format_prompt("Hello"), max_new_tokens=4)
+        startup.update(status="ready",
+                       model_load_seconds=round(model_load_seconds, 3),
+                       ready_seconds=round(time.perf_counter() - STARTED, 3))
+        logger.info(f"LLM ready {startup['ready_seconds']}s after start "
+                    f"(model load {startup['model_load_seconds']}s)")
+    except Exception as e:
+        startup.update(status="error", error=str(e))
+        logger.error(f"LLM startup failed: {str(e)}")
+
+@asynccontextmanager
+async def lifespan(app):
+    threading.Thread(target=start_llm, name="llm-load", daemon=True).start()
+    yield
+
+app = FastAPI(lifespan=lifespan)
+
+def format_prompt(prompt: str) -> str:
+    """Mistral instruction format for the GPU model, the tokenizer's chat template for the fallback."""
+    if startup["model"] == GPU_MODEL or not getattr(llm_tokenizer, "chat_template", None):
+        return f"[INST] {prompt} [/INST]"
+    return llm_tokenizer.apply_chat_template(
+        [{"role": "user", "content": prompt}], tokenize=False, add_generation_prompt=True)
 
 # --- Pydantic Models ---
 class GenerateRequest(BaseModel):
     prompt: str
     max_new_tokens: int = 256
+    temperature: float = 0.7   # 0 for greedy decoding
+    top_p: float = 0.95
+    repetition_penalty: float = 1.15
+    stream: bool = False       # NDJSON lines (or SSE with Accept: text/event-stream) as tokens arrive
+
+_WAITING = object()
+
+def record_first_request():
+    if startup["first_request_seconds"] is None:
+        startup["first_request_seconds"] = round(time.perf_counter() - STARTED, 3)
+        logger.info(f"First request served {startup['first_request_seconds']}s after start")
+
+def _next_token(tokens: queue.Queue):
+    try:
+        return tokens.get(timeout=1.0)
+    except queue.Empty:
+        return _WAITING
+
+def stream_response(gen, request: Request, start_time: float):
+    """
+    Stream a queued generation: {"token": "..."} per decoded piece, then a final
+    {"done": true, "response", "finish_reason", "tokens", "time_to_first_token"}
+    (or {"error": ...}). A client disconnect cancels the sequence in the scheduler.
+    """
+    sse = "text/event-stream" in request.headers.get("accept", "")
+
+    def frame(obj):
+        data = json.dumps(obj, ensure_ascii=False)
+        return f"data: {data}\n\n" if sse else data + "\n"
+
+    async def events():
+        loop = asyncio.get_running_loop()
+        cache, printed, started, count = [], 0, False, 0
+        try:
+            while True:
+                token = await loop.run_in_executor(None, _next_token, gen.tokens)
+                if token is _WAITING:
+                    if await request.is_disconnected():
+                        return
+                    continue
+                if token is None:
+                    break
+                count += 1
+                # decode incrementally (like transformers' TextStreamer), holding back split characters
+                cache.append(token)
+                text = llm_tokenizer.decode(cache, skip_special_tokens=True)
+                if text.endswith("\ufffd"):
+                    continue
+                piece = text[printed:]
+                if text.endswith("\n"):
+                    cache, printed = [], 0
+                else:
+                    printed = len(text)
+                if not started:
+                    piece = piece.lstrip()
+                    started = bool(piece)
+                if piece:
+                    record_first_request()
+                    yield frame({"token": piece})
+
+            error = gen.future.exception()
+            if error is not None:
+                yield frame({"error": str(error)})
+                return
+            record_first_request()  # an empty generation has no token frames
+            first = gen.first_token_at - start_time if gen.first_token_at else None
+            logger.info(f"Streamed {count} tokens in {time.perf_counter() - start_time:.2f}s "
+                        f"({gen.finish_reason})")
+            yield frame({"done": True, "response": gen.future.result(), "finish_reason": gen.finish_reason,
+                         "tokens": count, "time_to_first_token": round(first, 3) if first is not None else None})
+        finally:
+            if not gen.future.done():
+                gen.cancelled = True
+
+    media_type = "text/event-stream" if sse else "application/x-ndjson"
+    return StreamingResponse(events(), media_type=media_type, headers={"Cache-Control": "no-cache"})
 
 # --- LLM Generation Endpoint ---
 @app.post("/generate")
-def generate(req: GenerateRequest):
+def generate(req: GenerateRequest, request: Request):
+    if startup["status"] != "ready":
+        raise HTTPException(status_code=503, detail=f"Model {startup['status']}", headers={"Retry-After": "10"})
     try:
         logger.info(f"\n=== GENERATING {req.max_new_tokens} TOKENS ===")
-        
-        # Format for Mistral instruction following
-        formatted_prompt = f"[INST] {req.prompt} [/INST]"
-        
+
+        formatted_prompt = format_prompt(req.prompt)
+
         start_time = time.perf_counter()
-        
-        # Generate response
-        outputs = llm_pipeline(
+
+        if req.stream:
+            gen = llm_scheduler.submit(
+                formatted_prompt,
+                max_new_tokens=req.max_new_tokens,
+                temperature=req.temperature,
+                top_p=req.top_p,
+                repetition_penalty=req.repetition_penalty,
+                stream=True
+            )
+            return stream_response(gen, request, start_time)
+
+        # Queue for the scheduler; returns as soon as this sequence finishes
+        response = llm_scheduler.generate(
             formatted_prompt,
-            max_new_tokens=req.max_new_tokens
+            max_new_tokens=req.max_new_tokens,
+            temperature=req.temperature,
+            top_p=req.top_p,
+            repetition_penalty=req.repetition_penalty
         )
-        response = outputs[0]['generated_text']
-        
-        # Extract only the response after [/INST]
-        if "[/INST]" in response:
-            response = response.split("[/INST]", 1)[1].strip()
-        
+
         processing_time = time.perf_counter() - start_time
-        
+
         logger.info(f"Generated {len(response)} chars in {processing_time:.2f}s")
+        record_first_request()
         return {"response": response}
+    except ValueError as e:
+        # prompt plus max_new_tokens does not fit the model's context
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Generation failed: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-# Health check endpoint
+@app.get("/scheduler")
+def scheduler_stats():
+    if llm_scheduler is None:
+        raise HTTPException(status_code=503, detail=f"Model {startup['status']}")
+    return llm_scheduler.stats()
+
+# Health check endpoint: 200 once the model is loaded and warmed up, 503 before that
 @app.get("/health")
 def health_check():
-    return {
-        "status": "ready" if llm_pipeline else "error",
-        "torch_version": torch.__version__,
-        "cuda_available": torch.cuda.is_available()
-    }
\ No newline at end of file
+    return JSONResponse(status_code=200 if startup["status"] == "ready" else 503, content={
+        **startup,
+        "torch_version": torch.__version__ if torch else None,
+        "cuda_available": torch.cuda.is_available() if torch else None
+    })
@@ -0,0 +1,129 @@
+"""
+Shared-prefix KV cache for the generation scheduler.
+
+Prompts are hashed block by block (a chained hash over every `block_size` tokens), so
+each block boundary of a prompt has a key identifying the whole token prefix up to it.
+After a prefill, the prompt's KV state up to its last full block is stored once and
+every boundary key points at it: since attention is causal, the KV of a prefix is
+just a slice of the KV of any longer prompt that starts with it. A new prompt takes
+the longest boundary key that is present, reuses that slice and only prefills the
+rest. Entries are evicted least-recently-used once `max_bytes` is exceeded.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def block_hashes(token_ids, block_size: int):
+    """Chained hashes of each full block boundary: [(prefix length, key), ...]."""
+    hashes, digest = [], b""
+    ids = np.asarray(token_ids, dtype=np.int64)
+    for end in range(block_size, len(ids) + 1, block_size):
+        digest = hashlib.blake2b(digest + ids[end - block_size:end].tobytes(), digest_size=16).digest()
+        hashes.append((end, digest))
+    return hashes
+
+
+class PrefixEntry:
+    def __init__(self, layers, length, keys):
+        self.layers = layers      # per-layer (key, value), (1, heads, length, dim)
+        self.length = length
+        self.keys = set(keys)
+        self.nbytes = sum(t.numel() * t.element_size() for layer in layers for t in layer)
+
+
+class PrefixCache:
+    def __init__(self, max_bytes: int = 1 << 30, block_size: int = 64):
+        self.max_bytes = max_bytes
+        self.block_size = block_size
+        self._entries = OrderedDict()   # id -> PrefixEntry, least recently used first
+        self._index = {}                # boundary key -> entry id
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.lookups = 0
+        self.hits = 0
+        self.prompt_tokens = 0
+        self.reused_tokens = 0
+        self.evictions = 0
+
+    def lookup(self, token_ids):
+        """
+        Longest cached prefix of a prompt, leaving at least one token to prefill.
+        Returns (length, per-layer (key, value) slices) or (0, None).
+        """
+        hashes = block_hashes(token_ids[:-1], self.block_size)
+        with self._lock:
+            self.lookups += 1
+            self.prompt_tokens += len(token_ids)
+            for length, key in reversed(hashes):
+                entry_id = self._index.get(key)
+                if entry_id is None:
+                    continue
+                entry = self._entries[entry_id]
+                self._entries.move_to_end(entry_id)
+                self.hits += 1
+                self.reused_tokens += length
+                return length, [tuple(t[:, :, :length] for t in layer) for layer in entry.layers]
+        return 0, None
+
+    def store(self, token_ids, layers):
+        """Keep the KV of a prefilled prompt (batch of one) up to its last full block before the final token."""
+        hashes = block_hashes(token_ids[:-1], self.block_size)
+        if not hashes:
+            return
+        length, last_key = hashes[-1]
+        with self._lock:
+            if last_key in self._index:
+                self._entries.move_to_end(self._index[last_key])
+                return
+        entry = PrefixEntry([tuple(t[:, :, :length].clone() for t in layer) for layer in layers],
+                            length, [key for _, key in hashes])
+        if entry.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = entry
+            self.bytes += entry.nbytes
+            for key in entry.keys:
+                # the new entry covers every shorter prefix of the same prompt
+                previous = self._index.get(key)
+                if previous is not None and previous in self._entries:
+                    self._entries[previous].keys.discard(key)
+                self._index[key] = entry_id
+            for old_id in [i for i, e in self._entries.items() if not e.keys]:
+                self._drop(old_id)
+            while self.bytes > self.max_bytes and len(self._entries) > 1:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, entry_id):
+        entry = self._entries.pop(entry_id)
+        self.bytes -= entry.nbytes
+        for key in entry.keys:
+            if self._index.get(key) == entry_id:
+                del self._index[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._index.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "block_size": self.block_size,
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+                "token_hit_rate": self.reused_tokens / self.prompt_tokens if self.prompt_tokens else 0.0,
+                "reused_tokens": self.reused_tokens,
+                "evictions": self.evictions
+            }
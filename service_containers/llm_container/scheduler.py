@@ -0,0 +1,368 @@
+"""
+Continuous-batching generation scheduler for the LLM service.
+
+Requests are tokenized by the calling thread and queued. One worker thread owns the
+model and runs a decode loop over a batch of active sequences:
+
+  - at every step boundary, queued requests (up to `max_batch` active rows) are
+    prefilled together with left padding and their KV caches are merged into the
+    running batch (the shorter side is left-padded and masked out);
+  - each step feeds one token per row, samples per row (temperature, top-p,
+    repetition penalty of that request) and appends to each row's output;
+  - a row that emits EOS or reaches its own `max_new_tokens` resolves its future
+    immediately and is dropped from the batch, and leading cache columns that no
+    remaining row attends to are trimmed.
+
+Streaming requests also receive each token id on `req.tokens` as it is sampled (then
+None when the sequence ends); setting `req.cancelled` drops the row at the next step.
+
+Positions are derived from the attention mask, so padding never shifts a sequence.
+With a PrefixCache, each new prompt is prefilled on its own from the longest cached
+token prefix (see prefix_cache.py) before being merged into the batch.
+
+A prompt that cannot be prefilled (out of memory, say) fails only its own request;
+prompts whose prompt plus `max_new_tokens` exceed the model's context are rejected
+by `submit()` with a ValueError.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import torch
+
+try:
+    from transformers import DynamicCache
+except ImportError:  # older transformers: legacy tuple caches only
+    DynamicCache = None
+
+
+class GenerationRequest:
+    def __init__(self, prompt_ids, max_new_tokens=256, temperature=0.7, top_p=0.95, repetition_penalty=1.15,
+                 stream=False):
+        self.prompt_ids = prompt_ids
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.top_p = top_p
+        self.repetition_penalty = repetition_penalty
+        self.generated = []
+        self.tokens = queue.Queue() if stream else None
+        self.cancelled = False
+        self.finish_reason = None   # stop | length | cancelled
+        self.future = Future()
+        self.submitted = time.perf_counter()
+        self.first_token_at = None
+
+
+def _legacy(cache):
+    return cache.to_legacy_cache() if hasattr(cache, "to_legacy_cache") else cache
+
+
+def _model_cache(layers):
+    return DynamicCache.from_legacy_cache(layers) if DynamicCache is not None else layers
+
+
+def _left_pad(tensor, width, dim, value=0):
+    missing = width - tensor.shape[dim]
+    if missing <= 0:
+        return tensor
+    shape = list(tensor.shape)
+    shape[dim] = missing
+    return torch.cat([tensor.new_full(shape, value), tensor], dim=dim)
+
+
+class GenerationScheduler:
+    """Single-worker continuous-batching scheduler; `submit()` is safe from any thread."""
+
+    def __init__(self, model, tokenizer, max_batch: int = 8, max_wait_ms: float = 20.0, prefix_cache=None):
+        self.model = model
+        self.prefix_cache = prefix_cache
+        self.tokenizer = tokenizer
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.device = model.device
+        self.pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+        eos = model.generation_config.eos_token_id
+        eos = set(eos if isinstance(eos, (list, tuple)) else [eos]) | {tokenizer.eos_token_id}
+        self.eos_ids = {e for e in eos if e is not None}
+        # run the decoder body and project only the last position, so a long prefill
+        # never materializes (rows, length, vocab) logits
+        self.body = getattr(model, model.base_model_prefix, model)
+        self.head = model.get_output_embeddings()
+        self.vocab_size = self.head.weight.shape[0]
+        self.max_positions = getattr(model.config, "max_position_embeddings", None)
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._reset_batch()
+        self.completed = 0
+        self.generated_tokens = 0
+        self.prefill_tokens = 0
+        self.decode_steps = 0
+        self.active_row_steps = 0
+        self.busy_seconds = 0.0
+        self._worker = threading.Thread(target=self._run, name="llm-scheduler", daemon=True)
+        self._worker.start()
+
+    def _reset_batch(self):
+        self.rows = []
+        self.cache = None         # legacy per-layer (key, value) tuples, (rows, heads, length, dim)
+        self.mask = None          # (rows, length) attention mask over the cache
+        self.next_tokens = None   # (rows, 1) token to feed at the next step
+        self.seen = None          # (rows, vocab) tokens seen by each row, for the repetition penalty
+
+    # --- public API ---
+
+    def submit(self, prompt: str, max_new_tokens: int = 256, temperature: float = 0.7,
+               top_p: float = 0.95, repetition_penalty: float = 1.15, stream: bool = False) -> GenerationRequest:
+        ids = self.tokenizer(prompt, add_special_tokens=True)["input_ids"]
+        if self.max_positions and len(ids) + max_new_tokens > self.max_positions:
+            raise ValueError(f"Prompt of {len(ids)} tokens plus max_new_tokens={max_new_tokens} exceeds "
+                             f"the model's {self.max_positions} positions")
+        req = GenerationRequest(ids, max_new_tokens, temperature, top_p, repetition_penalty, stream)
+        if max_new_tokens <= 0:
+            req.finish_reason = "length"
+            self._finish(req)
+            return req
+        self._queue.put(req)
+        return req
+
+    def generate(self, prompt: str, **params) -> str:
+        """Queue a prompt and block until its sequence finishes; returns the decoded completion."""
+        return self.submit(prompt, **params).future.result()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "active": len(self.rows),
+                "max_batch": self.max_batch,
+                "completed": self.completed,
+                "generated_tokens": self.generated_tokens,
+                "prefill_tokens": self.prefill_tokens,
+                "mean_active_batch": self.active_row_steps / self.decode_steps if self.decode_steps else 0.0,
+                "tokens_per_second": self.generated_tokens / self.busy_seconds if self.busy_seconds else 0.0,
+                "prefix_cache": self.prefix_cache.stats() if self.prefix_cache is not None else None
+            }
+
+    # --- worker ---
+
+    def _run(self):
+        while True:
+            if not self.rows:
+                # idle: wait for a request, then give concurrent callers a moment to join
+                first = self._queue.get()
+                pending, deadline = [first], time.perf_counter() + self.max_wait
+                while len(pending) < self.max_batch:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    try:
+                        pending.append(self._queue.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+            else:
+                pending = []
+                while len(self.rows) + len(pending) < self.max_batch:
+                    try:
+                        pending.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+
+            start = time.perf_counter()
+            try:
+                with torch.inference_mode():
+                    if pending:
+                        self._admit(pending)
+                    if self.rows:
+                        self._step()
+            except Exception as e:
+                for req in self.rows + pending:
+                    if not req.future.done():
+                        self._fail(req, e)
+                self._reset_batch()
+                if self.prefix_cache is not None:
+                    self.prefix_cache.clear()
+                self._release_memory()
+            with self._lock:
+                self.busy_seconds += time.perf_counter() - start
+
+    def _forward(self, input_ids, mask, cache=None):
+        positions = (mask.cumsum(-1) - 1).clamp(min=0)[:, -input_ids.shape[1]:]
+        out = self.body(input_ids=input_ids, attention_mask=mask, position_ids=positions,
+                        past_key_values=_model_cache(cache) if cache is not None else None, use_cache=True)
+        return self.head(out.last_hidden_state[:, -1, :]).float(), _legacy(out.past_key_values)
+
+    def _finish(self, req):
+        req.future.set_result(self.tokenizer.decode(req.generated, skip_special_tokens=True).strip())
+        if req.tokens is not None:
+            req.tokens.put(None)
+
+    def _fail(self, req, error):
+        req.future.set_exception(error)
+        if req.tokens is not None:
+            req.tokens.put(None)
+
+    def _release_memory(self):
+        if self.device.type == "cuda":
+            torch.cuda.empty_cache()
+
+    def _admit(self, requests):
+        """Prefill new requests and merge them into the running batch; a failed prefill fails only its request."""
+        for req in [r for r in requests if r.cancelled]:
+            req.finish_reason = "cancelled"
+            self._finish(req)
+        requests = [r for r in requests if not r.cancelled]
+        if not requests:
+            return
+        pieces = None
+        if self.prefix_cache is None and len(requests) > 1:
+            try:
+                pieces = [self._prefill_batch(requests)]
+            except Exception:
+                self._release_memory()  # retry one at a time below to find the request at fault
+        if pieces is None:
+            # one prompt at a time, so each can start from its own cached prefix
+            pieces, admitted = [], []
+            for req in requests:
+                try:
+                    pieces.append(self._prefill(req))
+                    admitted.append(req)
+                except Exception as e:
+                    self._fail(req, e)
+                    self._release_memory()
+            requests = admitted
+            if not requests:
+                return
+        if len(pieces) == 1:
+            logits, mask, cache = pieces[0]
+        else:
+            logits = torch.cat([logits for logits, _, _ in pieces])
+            mask, cache = self._merge([(mask, cache) for _, mask, cache in pieces])
+
+        seen = torch.zeros((len(requests), self.vocab_size), dtype=torch.bool, device=self.device)
+        for row, req in enumerate(requests):
+            seen[row, torch.tensor(req.prompt_ids, device=self.device)] = True
+
+        if self.rows:
+            mask, cache = self._merge([(self.mask, self.cache), (mask, cache)])
+            seen = torch.cat([self.seen, seen])
+            logits = torch.cat([logits.new_zeros((len(self.rows), logits.shape[1])), logits])
+        self.cache, self.mask, self.seen = cache, mask, seen
+        offset = len(self.rows)
+        self.rows = self.rows + list(requests)
+        # the prefill logits give each new row its first token
+        tokens = self._sample(logits[offset:], self.rows[offset:], self.seen[offset:])
+        if offset:
+            self.next_tokens = torch.cat([self.next_tokens, tokens[:, None]])
+        else:
+            self.next_tokens = tokens[:, None]
+        self._emit(range(offset, len(self.rows)), tokens)
+
+    def _prefill_batch(self, requests):
+        """Prefill several prompts together with left padding; returns (logits, mask, cache)."""
+        width = max(len(r.prompt_ids) for r in requests)
+        input_ids = torch.tensor([[self.pad_id] * (width - len(r.prompt_ids)) + r.prompt_ids for r in requests],
+                                 device=self.device)
+        mask = torch.tensor([[0] * (width - len(r.prompt_ids)) + [1] * len(r.prompt_ids) for r in requests],
+                            device=self.device)
+        logits, cache = self._forward(input_ids, mask)
+        with self._lock:
+            self.prefill_tokens += int(mask.sum())
+        return logits, mask, cache
+
+    def _prefill(self, req):
+        """Prefill one prompt, starting from its longest cached prefix if any; returns (logits, mask, cache)."""
+        ids = req.prompt_ids
+        reused, prefix = self.prefix_cache.lookup(ids) if self.prefix_cache is not None else (0, None)
+        input_ids = torch.tensor([ids[reused:]], device=self.device)
+        mask = torch.ones((1, len(ids)), dtype=torch.long, device=self.device)
+        logits, cache = self._forward(input_ids, mask, prefix)
+        if self.prefix_cache is not None:
+            self.prefix_cache.store(ids, cache)
+        with self._lock:
+            self.prefill_tokens += len(ids) - reused
+        return logits, mask, cache
+
+    def _merge(self, parts):
+        """Stack (mask, cache) batches of different lengths, left-padding the shorter ones."""
+        length = max(mask.shape[1] for mask, _ in parts)
+        mask = torch.cat([_left_pad(m, length, 1) for m, _ in parts])
+        cache = [tuple(torch.cat([_left_pad(layers[i][j], length, 2) for _, layers in parts]) for j in range(2))
+                 for i in range(len(parts[0][1]))]
+        return mask, cache
+
+    def _step(self):
+        """Decode one token for every active row."""
+        self.mask = torch.cat([self.mask, self.mask.new_ones((len(self.rows), 1))], dim=1)
+        logits, self.cache = self._forward(self.next_tokens, self.mask, self.cache)
+        tokens = self._sample(logits, self.rows, self.seen)
+        self.next_tokens = tokens[:, None]
+        with self._lock:
+            self.decode_steps += 1
+            self.active_row_steps += len(self.rows)
+        self._emit(range(len(self.rows)), tokens)
+
+    def _sample(self, logits, rows, seen):
+        """Per-row repetition penalty, temperature and nucleus sampling (greedy when temperature == 0)."""
+        penalty = torch.tensor([r.repetition_penalty for r in rows], device=logits.device)[:, None]
+        penalized = torch.where(logits > 0, logits / penalty, logits * penalty)
+        logits = torch.where(seen, penalized, logits)
+
+        temperature = torch.tensor([r.temperature for r in rows], device=logits.device)[:, None]
+        greedy = logits.argmax(dim=-1)
+        scaled = logits / temperature.clamp(min=1e-5)
+        sorted_logits, sorted_idx = scaled.sort(dim=-1, descending=True)
+        probs = sorted_logits.softmax(dim=-1)
+        top_p = torch.tensor([r.top_p for r in rows], device=logits.device)[:, None]
+        drop = (probs.cumsum(dim=-1) - probs) > top_p
+        probs = probs.masked_fill(drop, 0.0)
+        sampled = sorted_idx.gather(1, torch.multinomial(probs, 1)).squeeze(1)
+        tokens = torch.where(temperature.squeeze(1) > 0, sampled, greedy)
+        seen.scatter_(1, tokens[:, None], True)
+        return tokens
+
+    def _emit(self, indices, tokens):
+        """Append sampled tokens, resolve finished rows and drop them from the batch."""
+        now = time.perf_counter()
+        finished = []
+        for i, token in zip(indices, tokens.tolist()):
+            req = self.rows[i]
+            if req.first_token_at is None:
+                req.first_token_at = now
+            if req.cancelled:
+                req.finish_reason = "cancelled"
+                finished.append(i)
+                continue
+            if token in self.eos_ids:
+                req.finish_reason = "stop"
+                finished.append(i)
+                continue
+            req.generated.append(token)
+            if req.tokens is not None:
+                req.tokens.put(token)
+            if len(req.generated) >= req.max_new_tokens:
+                req.finish_reason = "length"
+                finished.append(i)
+        with self._lock:
+            self.generated_tokens += len(tokens)
+            self.completed += len(finished)
+        if not finished:
+            return
+        for i in finished:
+            self._finish(self.rows[i])
+
+        done = set(finished)
+        keep = [i for i in range(len(self.rows)) if i not in done]
+        if not keep:
+            self._reset_batch()
+            return
+        index = torch.tensor(keep, device=self.device)
+        mask = self.mask[index]
+        # drop leading columns no remaining row attends to
+        start = int((mask.sum(dim=0) > 0).nonzero()[0])
+        self.mask = mask[:, start:]
+        self.cache = [tuple(t[index][:, :, start:] for t in layer) for layer in self.cache]
+        self.next_tokens = self.next_tokens[index]
+        self.seen = self.seen[index]
+        self.rows = [self.rows[i] for i in keep]
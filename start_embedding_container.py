@@ -1,22 +1,29 @@
+import argparse
 import subprocess
 import time
 
+from container_launcher import docker_gpu_args, wait_until_ready
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--gpus", default="auto", help="'auto' (all GPUs if nvidia-smi finds any), 'none', or a docker --gpus value")
+args = parser.parse_args()
+
 container_name = "voynich_api"
 
-# Start the container in detached mode
+start = time.perf_counter()
+
+# Start the container in detached mode (on the GPU when there is one)
 print("Starting container...")
 subprocess.run([
-    "docker", "run", "-d", "--rm", "--gpus", "all",
+    "docker", "run", "-d", "--rm", *docker_gpu_args(args.gpus),
     "--ipc=host", "--ulimit", "memlock=-1", "--ulimit", "stack=67108864",
     "--platform", "linux/amd64",
-    "-e", "NVIDIA_VISIBLE_DEVICES=all",
     "-p", "8000:8000",
     "--name", container_name,
     "voynich-embed:cuda12-1"
 ])
 
-# Wait briefly to allow container to boot up
-time.sleep(2)
+wait_until_ready("http://localhost:8000/health", timeout=300, start=start)
 
 # Show initial logs (non-blocking)
 print("\nContainer logs:")
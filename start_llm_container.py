@@ -1,25 +1,30 @@
+import argparse
 import subprocess
 import time
 
+from container_launcher import docker_gpu_args, wait_until_ready
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--gpus", default="auto", help="'auto' (all GPUs if nvidia-smi finds any), 'none', or a docker --gpus value")
+args = parser.parse_args()
+
 container_name = "voynich_llm_api"
 
-# Start the container in detached mode with volume and GPU access
-print("Starting container...")
+start = time.perf_counter()
 
+# Start the container in detached mode with volume and GPU access (when there is one)
+print("Starting container...")
 subprocess.run([
-    "docker", "run", "-d", "--rm", "--gpus", "all",
-    "--ipc=host", "--ulimit", "memlock=-1",
-    "--ulimit", "stack=67108864",
+    "docker", "run", "-d", "--rm", *docker_gpu_args(args.gpus),
+    "--ipc=host", "--ulimit", "memlock=-1", "--ulimit", "stack=67108864",
     "--platform", "linux/amd64",
-    "-e", "NVIDIA_VISIBLE_DEVICES=all",
     "-p", "8001:8001",
     "--name", container_name,
     "-v", "voynich-model-cache:/app/models/hf_cache",
     "voynich-llm"
 ])
 
-# Wait briefly to allow container to boot up
-time.sleep(2)
+wait_until_ready("http://localhost:8001/health", timeout=900, start=start)
 
 # Show initial logs (non-blocking)
 print("\nContainer logs:")
@@ -0,0 +1,244 @@
+import numpy as np
+
+from vocabulary import encode_corpus
+
+# marks an LCP interval whose occurrences are preceded by different words
+_DIVERSE = -(2 ** 62)
+
+
+def _suffix_array(text):
+    """
+    Prefix-doubling suffix array over an int64 sequence.
+    Returns (sa, ranks) where ranks[j] is the rank array of all prefixes of length 2**j,
+    used to answer LCP queries without re-reading the text.
+    """
+    n = len(text)
+    _, rank = np.unique(text, return_inverse=True)
+    rank = rank.astype(np.int64)
+    ranks = [rank]
+    k = 1
+    while True:
+        second = np.full(n, -1, dtype=np.int64)
+        second[:n - k] = rank[k:]
+        sa = np.lexsort((second, rank))
+        keys_changed = np.empty(n, dtype=bool)
+        keys_changed[0] = True
+        keys_changed[1:] = (rank[sa[1:]] != rank[sa[:-1]]) | (second[sa[1:]] != second[sa[:-1]])
+        new_rank = np.empty(n, dtype=np.int64)
+        new_rank[sa] = np.cumsum(keys_changed) - 1
+        rank = new_rank
+        ranks.append(rank)
+        if rank.max() == n - 1 or k >= n:
+            return sa, ranks
+        k *= 2
+
+
+def _adjacent_lcp(sa, ranks):
+    """LCP of each pair of SA neighbours (lcp[i] between sa[i - 1] and sa[i]; lcp[0] = 0)."""
+    n = len(sa)
+    a, b = sa[:-1].copy(), sa[1:].copy()
+    length = np.zeros(n - 1, dtype=np.int64)
+    for j in range(len(ranks) - 1, -1, -1):
+        step = 1 << j
+        # ranks[j] pads past the end with unique negatives so nothing matches there
+        padded = np.concatenate((ranks[j], -1 - np.arange(n + step, dtype=np.int64)))
+        same = padded[a + length] == padded[b + length]
+        length[same] += step
+    return np.concatenate(([0], length))
+
+
+class SuffixIndex:
+    """
+    Suffix array + LCP array over the integer-encoded word stream of an EncodedCorpus.
+
+    Every line ends with its own unique separator, so repeats never run across lines.
+    Maximal repeats are precomputed once as LCP intervals; later queries are
+    array filters and binary searches.
+    """
+
+    def __init__(self, corpus):
+        self.corpus = corpus
+        n_vocab = len(corpus.vocab.words)
+        n_lines = corpus.n_lines
+        line_lengths = np.diff(corpus.line_offsets)
+
+        # text = words of line 0, sep 0, words of line 1, sep 1, ...
+        self.line_starts = corpus.line_offsets[:-1] + np.arange(n_lines)
+        text = np.empty(corpus.n_words + n_lines, dtype=np.int64)
+        is_sep = np.zeros(len(text), dtype=bool)
+        is_sep[self.line_starts + line_lengths] = True
+        text[~is_sep] = corpus.word_ids
+        text[is_sep] = n_vocab + np.arange(n_lines)
+        self.text = text
+        self.position_line = np.repeat(np.arange(n_lines), line_lengths + 1)
+
+        self.sa, ranks = _suffix_array(text)
+        self.lcp = _adjacent_lcp(self.sa, ranks)
+        self._intervals = None
+
+    @classmethod
+    def from_records(cls, records):
+        """Index preprocess_takahashi records (list or RecordStore), ideally a single transcriber."""
+        return cls(encode_corpus(records))
+
+    # ---- locations -------------------------------------------------------
+
+    def location(self, pos):
+        line = int(self.position_line[pos])
+        corpus = self.corpus
+        return {
+            "page": corpus.pages[corpus.line_page[line]],
+            "line": corpus.line_labels[line],
+            "word": int(pos - self.line_starts[line]),
+            "section": corpus.sections[corpus.line_section[line]],
+            "transcriber": corpus.transcribers[corpus.line_transcriber[line]]
+        }
+
+    def _words(self, pos, length):
+        return self.corpus.vocab.decode_words(self.text[pos:pos + length])
+
+    # ---- exact sequence search --------------------------------------------
+
+    def _bound(self, pattern, upper):
+        """Binary search for the first SA row whose suffix is >= pattern (> pattern when upper)."""
+        text, sa, m = self.text, self.sa, len(pattern)
+        lo, hi = 0, len(sa)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            prefix = text[sa[mid]:sa[mid] + m]
+            # compare prefix with pattern lexicographically
+            diff = np.flatnonzero(prefix != pattern[:len(prefix)])
+            if len(diff):
+                less = prefix[diff[0]] < pattern[diff[0]]
+            else:
+                less = len(prefix) < m or upper
+            if less:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def sa_range(self, words):
+        """[lo, hi) range of suffix-array rows starting with the word sequence."""
+        ids = [self.corpus.vocab.word_ids.get(w) for w in words]
+        if not ids or None in ids:
+            return 0, 0
+        pattern = np.asarray(ids, dtype=np.int64)
+        return self._bound(pattern, upper=False), self._bound(pattern, upper=True)
+
+    def count(self, words):
+        lo, hi = self.sa_range(words)
+        return hi - lo
+
+    def occurrences(self, words):
+        """Every occurrence of a word sequence (list or space-separated string), in text order."""
+        if isinstance(words, str):
+            words = words.split()
+        lo, hi = self.sa_range(words)
+        return [self.location(pos) for pos in np.sort(self.sa[lo:hi])]
+
+    # ---- maximal repeats ---------------------------------------------------
+
+    def _lcp_intervals(self):
+        """
+        All LCP intervals (length, lb, rb, left-diverse) via one stack pass, computed once.
+        An interval is a maximal repeat when its occurrences are not all preceded
+        by the same word.
+        """
+        if self._intervals is not None:
+            return self._intervals
+        sa, lcp, text = self.sa, self.lcp.tolist(), self.text
+        prev = np.where(sa > 0, text[sa - 1], _DIVERSE).tolist()
+        n = len(sa)
+
+        def merge(a, b):
+            if a is None:
+                return b
+            if b is None or a == b:
+                return a
+            return _DIVERSE
+
+        lengths, lbs, rbs, diverse = [], [], [], []
+        stack = [[0, 0, None]]  # lcp length, left bound, left-context word
+        for i in range(1, n + 1):
+            h = lcp[i] if i < n else 0
+            leaf = prev[i - 1]
+            stack[-1][2] = merge(stack[-1][2], leaf)
+            lb, child_left = i - 1, None
+            while h < stack[-1][0]:
+                top_len, top_lb, top_left = stack.pop()
+                lengths.append(top_len)
+                lbs.append(top_lb)
+                rbs.append(i - 1)
+                diverse.append(top_left == _DIVERSE)
+                stack[-1][2] = merge(stack[-1][2], top_left)
+                lb, child_left = top_lb, top_left
+            if h > stack[-1][0]:
+                stack.append([h, lb, merge(child_left, leaf)])
+
+        self._intervals = (np.asarray(lengths, dtype=np.int64), np.asarray(lbs, dtype=np.int64),
+                           np.asarray(rbs, dtype=np.int64), np.asarray(diverse, dtype=bool))
+        return self._intervals
+
+    def maximal_repeats(self, min_length=2, min_count=2, limit=50, with_locations=False):
+        """
+        Maximal repeated word sequences of at least `min_length` words occurring at
+        least `min_count` times, longest (then most frequent) first.
+        """
+        lengths, lbs, rbs, diverse = self._lcp_intervals()
+        counts = rbs - lbs + 1
+        keep = np.flatnonzero(diverse & (lengths >= min_length) & (counts >= min_count))
+        keep = keep[np.lexsort((-counts[keep], -lengths[keep]))]
+        if limit is not None:
+            keep = keep[:limit]
+        repeats = []
+        for k in keep:
+            first = self.sa[lbs[k]]
+            repeat = {
+                "words": self._words(first, lengths[k]),
+                "length": int(lengths[k]),
+                "count": int(counts[k])
+            }
+            if with_locations:
+                repeat["locations"] = [self.location(p) for p in np.sort(self.sa[lbs[k]:rbs[k] + 1])]
+            repeats.append(repeat)
+        return repeats
+
+    # ---- cross-section comparison ----------------------------------------
+
+    def longest_common_sequences(self, section_a, section_b, top=10, min_length=1):
+        """
+        Longest word sequences shared by two sections (e.g. 'Herbal' and 'Biological').
+        The suffix array is restricted to suffixes of the two sections; the LCP of
+        consecutive kept rows is the minimum LCP over the skipped rows between them.
+        """
+        corpus = self.corpus
+        codes = {name: i for i, name in enumerate(corpus.sections)}
+        if section_a not in codes or section_b not in codes:
+            return []
+        row_section = corpus.line_section[self.position_line[self.sa]]
+        rows = np.flatnonzero((row_section == codes[section_a]) | (row_section == codes[section_b]))
+        if len(rows) < 2:
+            return []
+        # min over lcp[rows[t-1] + 1 .. rows[t]] is the LCP of the kept neighbours
+        padded_lcp = np.append(self.lcp, 0)
+        pair_lcp = np.minimum.reduceat(padded_lcp, np.append(rows[:-1] + 1, rows[-1] + 1))[:-1]
+        crosses = row_section[rows[1:]] != row_section[rows[:-1]]
+        candidates = np.flatnonzero(crosses & (pair_lcp >= min_length))
+        candidates = candidates[np.argsort(-pair_lcp[candidates], kind='stable')]
+
+        results, seen = [], set()
+        for t in candidates:
+            length = int(pair_lcp[t])
+            pos_a, pos_b = self.sa[rows[t]], self.sa[rows[t + 1]]
+            words = tuple(self._words(pos_a, length))
+            if words in seen:
+                continue
+            seen.add(words)
+            loc_a, loc_b = self.location(pos_a), self.location(pos_b)
+            if loc_a["section"] != section_a:
+                loc_a, loc_b = loc_b, loc_a
+            results.append({"words": list(words), "length": length, section_a: loc_a, section_b: loc_b})
+            if len(results) == top:
+                break
+        return results
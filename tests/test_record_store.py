@@ -0,0 +1,25 @@
+import numpy as np
+
+from record_store import RecordStore
+
+
+def _store():
+    return RecordStore.from_records([
+        {"page": f"f{i}r", "paragraph": "P1", "row": "1", "transcriber": "H", "section": "Herbal",
+         "raw": f"daiin {i}", "tokens": ["daiin", str(i)]}
+        for i in range(3)
+    ])
+
+
+def test_select_indices_and_mask():
+    store = _store()
+    assert [r["page"] for r in store.select([2, 0])] == ["f2r", "f0r"]
+    assert [r["page"] for r in store.select(np.array([False, True, False]))] == ["f1r"]
+
+
+def test_select_empty():
+    store = _store()
+    for selection in ([], np.array([], dtype=bool), np.zeros(3, dtype=bool)):
+        empty = store.select(selection)
+        assert len(empty) == 0
+        assert list(empty) == [] and empty.tokens == []
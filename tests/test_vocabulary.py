@@ -0,0 +1,35 @@
+from pathlib import Path
+
+import pytest
+
+from pre_processing import preprocess_takahashi
+from vocabulary import encode_corpus, normalize_token, tokenize_eva
+
+EVA_PATH = Path(__file__).resolve().parents[1] / "data" / "raw" / "voynich_eva.txt"
+MARKUP = set("!*%?{}<>.,=-&;")
+
+
+def test_tokenize_eva_drops_markup():
+    line = "fachys.ykal{plant}.ar,ataiin-shol{&252}.sh*ry.cth!res=<->kor.{label y-}%"
+    assert tokenize_eva(line) == ["fachys", "ykal", "ar", "ataiin", "cthres", "kor"]
+
+
+def test_normalize_token_strips_comments_and_markers():
+    assert normalize_token("cth!res") == "cthres"
+    assert normalize_token("<->kor=") == "kor"
+    assert normalize_token("**!") == ""
+
+
+@pytest.mark.parametrize("token", ["sh*ry", "ody?", "%", "{&T}ody", "shol{&252}"])
+def test_normalize_token_drops_unreadable_words(token):
+    assert normalize_token(token) == ""
+
+
+@pytest.mark.skipif(not EVA_PATH.exists(), reason="interlinear EVA file not available")
+@pytest.mark.parametrize("transcriber", ["H", None])
+def test_no_markup_survives_encoding(transcriber):
+    corpus = encode_corpus(preprocess_takahashi(EVA_PATH, transcriber))
+    assert corpus.n_words
+    assert not MARKUP & set(corpus.vocab.glyphs)
+    assert all(glyph.isalpha() and glyph.islower() for glyph in corpus.vocab.glyphs)
+    assert not any(MARKUP & set(word) for word in corpus.vocab.words)
@@ -4,6 +4,8 @@ from pathlib import Path
 from typing import Any, Union
 import openai
 
+from embedding_store import is_embedding_store, load_embedding_store
+
 def build_folder_tree_dict(base_path):
     tree = {}
     for entry in os.listdir(base_path):
@@ -16,8 +18,12 @@ def build_folder_tree_dict(base_path):
 
 
 def load_language_embeddings(path, language_name):
-    """Load embeddings from JSONL files with error handling"""
+    """Load embeddings from JSONL files (or a binary EmbeddingStore directory) with error handling"""
     records = []
+    if is_embedding_store(path):
+        records = list(load_embedding_store(path))
+        print(f"Loaded {len(records)} records for {language_name}")
+        return records
     try:
         with open(path, "r", encoding="utf-8") as f:
             for line in f:
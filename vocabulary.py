@@ -0,0 +1,255 @@
+import json
+import re
+
+import numpy as np
+
+from record_store import RecordStore
+
+# Interlinear EVA markup that is not part of the script:
+#  - ligature/high-ascii glyph codes ({&252}, {&T}): glyphs outside basic EVA
+GLYPH_CODE = re.compile(r'\{&[^}]*\}')
+#  - inline comments ({plant}, {label y-}) and <...> fragments
+EVA_COMMENT = re.compile(r'\{[^}]*\}|<[^>]*>')
+#  - word breaks: '.' certain space, ',' uncertain space (split like a space, so word
+#    lengths do not depend on how sure the transcriber was), '-' line/plant break,
+#    '=' paragraph end
+WORD_SEPARATORS = re.compile(r'[\s.,=\-]+')
+#  - '!' pads interlinear readings so transcribers stay aligned: not a glyph
+FILLER_GLYPHS = '!'
+_FILLERS = str.maketrans('', '', FILLER_GLYPHS)
+#  - '*' and '%' mark illegible / unreadable glyphs and '?' an unidentified one. Their
+#    words are dropped rather than respelled without them, which would join the
+#    remaining letters into words that were never written; glyph codes count as '?'
+UNREADABLE_GLYPHS = frozenset('*%?')
+# bumped whenever tokenization changes, so reports cached from older tokens are rebuilt
+TOKENIZER_VERSION = 3
+
+
+def normalize_token(token):
+    """
+    EVA word as used by the vocabulary: the token without comments, separators
+    (for tokens that were split some other way) or filler markers, or '' when
+    it contains an unreadable glyph.
+    """
+    token = EVA_COMMENT.sub('', GLYPH_CODE.sub('?', token))
+    token = WORD_SEPARATORS.sub('', token)
+    if UNREADABLE_GLYPHS.intersection(token):
+        return ''
+    return token.translate(_FILLERS)
+
+
+def tokenize_eva(text):
+    """Split a line of interlinear EVA into words, dropping all markup (see above)."""
+    text = EVA_COMMENT.sub(' ', GLYPH_CODE.sub('?', text))
+    words = (normalize_token(w) for w in WORD_SEPARATORS.split(text))
+    return [w for w in words if w]
+
+
+class Vocabulary:
+    """
+    Interning tables for EVA words and glyphs (single EVA characters).
+    Ids are dense, assigned in order of first appearance.
+    """
+
+    def __init__(self, words=None, glyphs=None):
+        self.words = []
+        self.word_ids = {}
+        self.glyphs = []
+        self.glyph_ids = {}
+        # glyph spelling of every word, flattened: glyphs of word w are
+        # word_glyphs[word_glyph_offsets[w]:word_glyph_offsets[w + 1]]
+        self._word_glyphs = []
+        self._word_glyph_offsets = [0]
+        for glyph in glyphs or []:
+            self.add_glyph(glyph)
+        for word in words or []:
+            self.add_word(word)
+
+    def __len__(self):
+        return len(self.words)
+
+    def add_glyph(self, glyph):
+        gid = self.glyph_ids.get(glyph)
+        if gid is None:
+            gid = self.glyph_ids[glyph] = len(self.glyphs)
+            self.glyphs.append(glyph)
+        return gid
+
+    def add_word(self, word):
+        wid = self.word_ids.get(word)
+        if wid is None:
+            wid = self.word_ids[word] = len(self.words)
+            self.words.append(word)
+            self._word_glyphs.extend(self.add_glyph(g) for g in word)
+            self._word_glyph_offsets.append(len(self._word_glyphs))
+        return wid
+
+    def spelling_arrays(self):
+        """(word_glyphs, word_glyph_offsets) as NumPy arrays, indexed by word id."""
+        return (np.asarray(self._word_glyphs, dtype=np.int32),
+                np.asarray(self._word_glyph_offsets, dtype=np.int64))
+
+    def encode_words(self, words):
+        return np.asarray([self.add_word(w) for w in words], dtype=np.int32)
+
+    def decode_words(self, ids):
+        return [self.words[i] for i in ids]
+
+    def decode_glyphs(self, ids):
+        return ''.join(self.glyphs[i] for i in ids)
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({"glyphs": self.glyphs, "words": self.words}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(words=data["words"], glyphs=data["glyphs"])
+
+
+class EncodedCorpus:
+    """
+    Integer-encoded Voynich corpus.
+
+    Arrays (all NumPy):
+      - word_ids (int32, one per word in reading order)
+      - glyph_ids (int32, the glyphs of every word, concatenated)
+      - word_offsets (int64, n_words + 1): glyph span of each word
+      - line_offsets (int64, n_lines + 1): word span of each line
+      - page_offsets (int64, n_pages + 1): line span of each page run
+      - line_page / line_section / line_transcriber (int32 codes per line,
+        decoded through pages / sections / transcribers)
+    """
+
+    def __init__(self, vocab, word_ids, line_offsets, line_page, line_section, line_transcriber,
+                 pages, sections, transcribers, line_labels):
+        self.vocab = vocab
+        self.word_ids = word_ids
+        self.line_offsets = line_offsets
+        self.line_page = line_page
+        self.line_section = line_section
+        self.line_transcriber = line_transcriber
+        self.pages = pages
+        self.sections = sections
+        self.transcribers = transcribers
+        self.line_labels = line_labels  # "page.paragraph.row" per line
+        self._word_line = None
+        self._glyph_word = None
+
+        # Glyph stream: gather the spelling of each word from the vocabulary
+        spelled, spelled_offsets = vocab.spelling_arrays()
+        starts = spelled_offsets[word_ids]
+        lengths = spelled_offsets[word_ids + 1] - starts
+        self.word_offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+        within = np.arange(self.word_offsets[-1]) - np.repeat(self.word_offsets[:-1], lengths)
+        self.glyph_ids = spelled[np.repeat(starts, lengths) + within]
+
+        run_starts = np.flatnonzero(np.diff(line_page)) + 1
+        self.page_offsets = np.concatenate(([0], run_starts, [len(line_page)])).astype(np.int64)
+
+    @property
+    def n_words(self):
+        return len(self.word_ids)
+
+    @property
+    def n_lines(self):
+        return len(self.line_offsets) - 1
+
+    def word_lengths(self):
+        return np.diff(self.word_offsets)
+
+    def word_line(self):
+        """Line index of every word (computed once)."""
+        if self._word_line is None:
+            self._word_line = np.repeat(np.arange(self.n_lines, dtype=np.int32), np.diff(self.line_offsets))
+        return self._word_line
+
+    def glyph_word(self):
+        """Word index of every glyph (computed once)."""
+        if self._glyph_word is None:
+            self._glyph_word = np.repeat(np.arange(self.n_words, dtype=np.int32), self.word_lengths())
+        return self._glyph_word
+
+    def word_counts(self):
+        return np.bincount(self.word_ids, minlength=len(self.vocab.words))
+
+    def glyph_counts(self):
+        return np.bincount(self.glyph_ids, minlength=len(self.vocab.glyphs))
+
+    def line_words(self, line):
+        return self.vocab.decode_words(self.word_ids[self.line_offsets[line]:self.line_offsets[line + 1]])
+
+    def lines_where(self, section=None, transcriber=None, page=None):
+        """Boolean mask over lines matching the given metadata."""
+        mask = np.ones(self.n_lines, dtype=bool)
+        for value, names, codes in ((section, self.sections, self.line_section),
+                                    (transcriber, self.transcribers, self.line_transcriber),
+                                    (page, self.pages, self.line_page)):
+            if value is not None:
+                mask &= codes == (names.index(value) if value in names else -1)
+        return mask
+
+
+def encode_corpus(records, vocab=None):
+    """
+    Encode preprocess_takahashi records (a list of dicts or a RecordStore)
+    into an EncodedCorpus. Pass an existing Vocabulary to keep ids stable
+    across corpora; it is extended with unseen words.
+    """
+    vocab = vocab or Vocabulary()
+    token_cache = {}
+
+    def word_id(token):
+        wid = token_cache.get(token)
+        if wid is None:
+            word = normalize_token(token)
+            wid = token_cache[token] = vocab.add_word(word) if word else -1
+        return wid
+
+    if isinstance(records, RecordStore):
+        token_ids = np.fromiter((word_id(t) for t in records.tokens), dtype=np.int32,
+                                count=len(records.tokens))
+        keep = token_ids >= 0
+        kept_before = np.concatenate(([0], np.cumsum(keep)))
+        word_ids = token_ids[keep]
+        line_offsets = kept_before[records.token_offsets]
+        pages, sections, transcribers = (list(records.values[f]) for f in ('page', 'section', 'transcriber'))
+        line_page, line_section, line_transcriber = (
+            records.codes[f].copy() for f in ('page', 'section', 'transcriber'))
+        line_labels = [f"{records.value('page', i)}.{records.value('paragraph', i)}.{records.value('row', i)}"
+                       for i in range(len(records))]
+    else:
+        ids, line_offsets, line_labels = [], [0], []
+        meta = {'page': ([], {}, []), 'section': ([], {}, []), 'transcriber': ([], {}, [])}
+        for rec in records:
+            for tok in rec['tokens']:
+                wid = word_id(tok)
+                if wid >= 0:
+                    ids.append(wid)
+            line_offsets.append(len(ids))
+            for field, (names, lookup, codes) in meta.items():
+                value = rec[field]
+                if value not in lookup:
+                    lookup[value] = len(names)
+                    names.append(value)
+                codes.append(lookup[value])
+            line_labels.append(f"{rec['page']}.{rec['paragraph']}.{rec['row']}")
+        word_ids = np.asarray(ids, dtype=np.int32)
+        pages, sections, transcribers = (meta[f][0] for f in ('page', 'section', 'transcriber'))
+        line_page, line_section, line_transcriber = (
+            np.asarray(meta[f][2], dtype=np.int32) for f in ('page', 'section', 'transcriber'))
+
+    return EncodedCorpus(
+        vocab=vocab,
+        word_ids=word_ids,
+        line_offsets=np.asarray(line_offsets, dtype=np.int64),
+        line_page=line_page,
+        line_section=line_section,
+        line_transcriber=line_transcriber,
+        pages=pages,
+        sections=sections,
+        transcribers=transcribers,
+        line_labels=line_labels
+    )